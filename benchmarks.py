@@ -0,0 +1,71 @@
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from ffbot_globals import get_players_from_html, parse_stat_tables
+
+
+def full_parse_players(html):
+    """
+    The original get_players_from_page: a full parse of the page, then a scan of every link.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    players = []
+    for a in soup.find_all('a', href=True):
+        if 'https://sports.yahoo.com/nfl/players/' in a['href'] and 'news' not in a['href']:
+            players.append(a['href'].split('/')[-1])
+    return players
+
+
+def benchmark_player_extraction(paths, repeat=20):
+    """
+    Times player extraction on saved pages (e.g. a team page and a trade page saved from the browser). The full parse
+    is compared against get_players_from_html with each parser available.
+
+    :param paths: A list of paths to saved .html pages.
+    :param repeat: The number of times each page is parsed.
+    """
+    extractors = {'full parse': full_parse_players, 'strained': get_players_from_html}
+    try:
+        import lxml
+        extractors['strained (lxml)'] = lambda html: get_players_from_html(html, parser='lxml')
+    except ImportError:
+        pass
+
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        expected = full_parse_players(html)
+        print(f'{path}: {len(html) / 1024:.0f} KB, {len(expected)} player links')
+        for name, extract in extractors.items():
+            if extract(html) != expected:
+                print(f'    {name}: players differ from the full parse')
+            seconds = timeit.timeit(lambda: extract(html), number=repeat) / repeat
+            print(f'    {name}: {seconds * 1000:.1f} ms')
+
+
+def benchmark_stat_tables(paths, repeat=20):
+    """
+    Times parse_stat_tables on saved team pages (saved with projected stats showing), parsing the whole page and
+    parsing only the stat tables (as TraderBot does, from the tables' HTML).
+
+    :param paths: A list of paths to saved .html team pages.
+    :param repeat: The number of times each page is parsed.
+    """
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        records = parse_stat_tables(html)
+        # what TraderBot.stat_tables sends back
+        tables = ''.join(str(table) for table in BeautifulSoup(html, 'html.parser').select('table[id^="statTable"]'))
+        print(f'{path}: {len(html) / 1024:.0f} KB ({len(tables) / 1024:.0f} KB of stat tables), {len(records)} players')
+        for name, source in [('page', html), ('stat tables', tables)]:
+            seconds = timeit.timeit(lambda: parse_stat_tables(source), number=repeat) / repeat
+            print(f'    {name}: {seconds * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    # python benchmarks.py players page.html ... / python benchmarks.py stats team_page.html ...
+    benchmarks = {'players': benchmark_player_extraction, 'stats': benchmark_stat_tables}
+    benchmarks[sys.argv[1]](sys.argv[2:])
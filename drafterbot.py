@@ -12,16 +12,27 @@ import requests
 import yahoo_fantasy_api as yfa
 import objectpath
 import numpy as np
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
 import time
+import copy
+import collections
+import queue
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import heapq
+import itertools
 from datetime import datetime
 import os
+import shutil
+import tempfile
+from ffbot_globals import PLAYER_DATA_PATH, with_retries
 
 # override this method to show stat_id
 def new_stat_categories(self):
@@ -81,14 +92,40 @@ def get_league(oauth, n=0):
     return league
 
 
-def create_player_lists(league, save=True):
+PLAYER_CACHE_DIR = 'player-data/cache'
+# bump when the cache layout changes
+PLAYER_CACHE_VERSION = 1
 
-    qbs = [(player['player_id'], player['name']) for player in league.free_agents('QB')]
-    rbs = [(player['player_id'], player['name']) for player in league.free_agents('RB')]
-    wrs = [(player['player_id'], player['name']) for player in league.free_agents('WR')]
-    tes = [(player['player_id'], player['name']) for player in league.free_agents('TE')]
-    ks = [(player['player_id'], player['name']) for player in league.free_agents('K')]
-    defs = [(player['player_id'], player['name']) for player in league.free_agents('DEF')]
+OVERRIDES_PATH = 'player-data/projection_overrides.json'
+OVERRIDES_VERSION = 1
+
+# the Yahoo API returns at most 25 players per request
+YAHOO_BATCH_SIZE = 25
+
+
+def fetch_batched(executor, fetch, player_ids, batch_size=YAHOO_BATCH_SIZE, **kwargs):
+    """
+    Splits player IDs into batches and fetches them concurrently.
+
+    :param executor: A ThreadPoolExecutor to run the requests on.
+    :param fetch: A function taking a list of player IDs (and kwargs) and returning a list of results.
+    :param player_ids: A list of player IDs.
+    :param batch_size: The number of players per request.
+    :return: A list of futures, one per batch.
+    """
+    batches = [player_ids[i:i + batch_size] for i in range(0, len(player_ids), batch_size)]
+    return [executor.submit(with_retries, fetch, batch, **kwargs) for batch in batches]
+
+
+def create_player_lists(league, save=True, max_workers=6):
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        player_lists = executor.map(
+            lambda pos: with_retries(league.free_agents, pos), ['QB', 'RB', 'WR', 'TE', 'K', 'DEF']
+        )
+        qbs, rbs, wrs, tes, ks, defs = [
+            [(player['player_id'], player['name']) for player in players] for players in player_lists
+        ]
 
     if save:
         with open('player-lists/qbs.json', 'w') as f:
@@ -134,10 +171,127 @@ def load_player_lists():
     return qbs, rbs, wrs, tes, ks, defs
 
 
+def session_from_driver(driver, pool_size=10):
+    """
+    Creates a requests session that reuses a logged in webdriver's cookies.
+
+    :param driver: A selenium webdriver object, logged into Yahoo.
+    :param pool_size: The number of pooled connections to keep open.
+    :return: A requests.Session.
+    """
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    session.headers['User-Agent'] = driver.execute_script('return navigator.userAgent;')
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    return session
+
+
+def projection_page_url(league_id, start=0):
+    url = f'https://football.fantasysports.yahoo.com/f1/{league_id}/players'
+    url += f'?status=ALL&pos=O&cut_type=9&stat1=S_PS_2020&myteam=1&sort=PR&sdir=1&count={start}'
+    return url
+
+
+def parse_projection_page(html):
+    """
+    Parses one page of the Yahoo players table.
+
+    :param html: The page's HTML.
+    :return: A dict of player IDs to projected points.
+    """
+    player_projs = {}
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('table'))
+    for row in soup.select('tbody tr'):
+        cells = row.find_all('td', recursive=False)
+        if len(cells) < 7:
+            continue
+        # name is in the 2nd column, projection in the 7th
+        anchor = cells[1].find(
+            'a', href=lambda href: href and '/nfl/players/' in href and 'news' not in href
+        )
+        proj = cells[6].find('span')
+        if anchor is None or proj is None:
+            continue
+        try:
+            player_projs[int(anchor['href'].split('/')[-1])] = float(proj.text)
+        except ValueError:
+            # projections are shown as '-' for some players
+            pass
+    return player_projs
+
+
+def fetch_projections(session, league_id, pages=17, max_workers=8):
+    """
+    Fetches the pages of the players table in parallel and parses their projections.
+
+    :param session: A requests session logged into Yahoo (see session_from_driver).
+    :param league_id: Your league ID.
+    :param pages: The number of 25 player pages to fetch.
+    :param max_workers: The number of pages to fetch at once.
+    :return: A dict of player IDs to projected points.
+    """
+    def fetch_page(url):
+        response = session.get(url, timeout=10)
+        response.raise_for_status()
+        return parse_projection_page(response.text)
+
+    urls = [projection_page_url(league_id, start) for start in range(0, pages * 25, 25)]
+    player_projs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page_projs in executor.map(lambda url: with_retries(fetch_page, url), urls):
+            player_projs.update(page_projs)
+    return player_projs
+
+
+def league_scoring(league):
+    """
+    Gets a league's scoring settings.
+
+    :param league: A yahoo_fantasy_api League.
+    :return: A dict of stat names to stat IDs, and a dict of stat IDs to points per stat.
+    """
+    stats_to_ids = {stat['display_name']: stat['stat_id'] for stat in league.stat_categories()}
+
+    stat_mods_list = league.settings()['stat_modifiers']['stats']
+    ids_to_mods = {stat['stat']['stat_id']: float(stat['stat']['value']) for stat in stat_mods_list}
+
+    return stats_to_ids, ids_to_mods
+
+
+def scoring_weights(columns, stats_to_ids, ids_to_mods):
+    """
+    Builds the points per stat for each column. Columns that aren't scored get a weight of 0.
+
+    :param columns: A list of stat column names.
+    :param stats_to_ids: A dict of stat names to stat IDs.
+    :param ids_to_mods: A dict of stat IDs to points per stat, or a list of them (one per scoring setting).
+    :return: A numpy array of shape (columns,), or (columns, settings) if ids_to_mods is a list.
+    """
+    if isinstance(ids_to_mods, dict):
+        return scoring_weights(columns, stats_to_ids, [ids_to_mods])[:, 0]
+    return np.array([[mods.get(stats_to_ids.get(col), 0) for mods in ids_to_mods] for col in columns],
+                    dtype=float).reshape(len(columns), len(ids_to_mods))
+
+
+def fantasy_points(df, stats_to_ids, ids_to_mods):
+    """
+    Scores every player with one matrix product of their stats and the scoring weights.
+
+    :param df: A DataFrame of player stats, with stat names as columns.
+    :param stats_to_ids: A dict of stat names to stat IDs.
+    :param ids_to_mods: A dict of stat IDs to points per stat, or a list of them to score several settings at once.
+    :return: A numpy array of points per player, or of shape (players, settings) if ids_to_mods is a list.
+    """
+    columns = [col for col in df.columns if col in stats_to_ids]
+    return df[columns].to_numpy(dtype=float) @ scoring_weights(columns, stats_to_ids, ids_to_mods)
+
+
 # missing point calcs for kickers + defenses
-def create_df(league, load_players=True, save=True, get_projs=True):
+def create_df(league, load_players=True, save=True, get_projs=True, max_workers=8, session=None):
     
     data = {}
+    positions = {}
 
     # flattens tuple output from load_player_lists, takes only the player id
     print('Loading players...')
@@ -145,43 +299,40 @@ def create_df(league, load_players=True, save=True, get_projs=True):
         player_ids = [player[0] for position in load_player_lists() for player in position]
     else:
         player_ids = [player[0] for position in create_player_lists(league, save=False) for player in position]
+    # some players are listed under more than one position
+    player_ids = list(dict.fromkeys(player_ids))
     
     print('Getting player data...')
-    season_data = league.player_stats(player_ids, 'season', season=current_year-1)
-    for player_data in season_data:
-        data[player_data['player_id']] = player_data
+    # stats and details (for positions) are fetched at the same time, in batches
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        stats_futures = fetch_batched(executor, league.player_stats, player_ids,
+                                      req_type='season', season=current_year-1)
+        details_futures = fetch_batched(executor, league.player_details, player_ids)
+        for future in as_completed(stats_futures + details_futures):
+            if future in stats_futures:
+                for player_data in future.result():
+                    data[player_data['player_id']] = player_data
+            else:
+                for player in future.result():
+                    positions[int(player['player_id'])] = player['primary_position']
 
+    # keep the order of player_ids regardless of which batch finished first
     df = pd.DataFrame.from_dict(data, orient='index')
+    df = df.reindex([player_id for player_id in player_ids if player_id in data])
 
     print('Updating stats...')
     df.rename_axis('Player ID', inplace=True)
     del df['player_id']
 
-    # find primary position of players
-    def find_position(player_ids):
-        player_info = league.player_details(player_ids)
-        return [player['primary_position'] for player in player_info]
-
-    df['position'] = find_position(list(df.index.to_numpy()))
+    # primary position of players
+    df['position'] = [positions.get(player_id) for player_id in df.index]
     del df['position_type']
     
     df.fillna(value=0, inplace=True)
 
     # calculate fantasy_points
-    df['Fantasy Pts'] = 0
-
-    stats_to_ids = {stat['display_name']: stat['stat_id'] for stat in league.stat_categories()}
-
-    stat_mods_list = league.settings()['stat_modifiers']['stats']
-    ids_to_mods = {stat['stat']['stat_id']: float(stat['stat']['value']) for stat in stat_mods_list}
-    
-    stat_mods = {name: ids_to_mods[stat_id] for name, stat_id in stats_to_ids.items()}
-
-    for label, content in df.iteritems():
-        try:
-            df['Fantasy Pts'] += content * stat_mods[label]
-        except KeyError:
-            pass
+    stats_to_ids, ids_to_mods = league_scoring(league)
+    df['Fantasy Pts'] = fantasy_points(df, stats_to_ids, ids_to_mods)
 
     df.sort_values(by=['Fantasy Pts'], ascending=False, inplace=True)
     
@@ -190,35 +341,16 @@ def create_df(league, load_players=True, save=True, get_projs=True):
     if get_projs:
     
         print('Getting 2020 projections...')
-        
-        
-        driver = webdriver.Chrome('/Users/School/Desktop/repos/auto-ff/chromedriver', service_log_path='/dev/null')
-
-        proj_2020_link = f'https://football.fantasysports.yahoo.com/f1/{league.settings()["league_id"]}/players'
-        proj_2020_link += '?status=ALL&pos=O&cut_type=9&stat1=S_PS_2020&myteam=1&sort=PR&sdir=1&count=0'
-        driver.get(proj_2020_link)
-
-        input('Press enter once logged in: ')
-
-        player_projs = {}
-
-        for i in range(0, 425, 25):
-            for row_num in range(1, 26):
-                row_xpath = f'/html/body/div[1]/div[2]/div[2]/div[2]/div/div/div[2]/div[2]/section/div/div/div[3]/' \
-                            f'section[2]/div/div/div[2]/table/tbody/tr[{row_num}]/'
-                name_xpath = row_xpath + 'td[2]/div/div[1]/div/a'
-                anchor = driver.find_element_by_xpath(name_xpath)
-                player_id = anchor.get_attribute('href').split('/')[-1]
 
-                # get projection
-                # using soup doesnt work for some reason— not all trs are fully loaded???
-                proj_path = row_xpath + 'td[7]/div/span'
-                proj = driver.find_element_by_xpath(proj_path)
-                player_projs[int(player_id)] = float(proj.text)
+        if session is None:
+            # log in once through the browser, then fetch pages with its cookies
+            driver = webdriver.Chrome('/Users/School/Desktop/repos/auto-ff/chromedriver', service_log_path='/dev/null')
+            driver.get(projection_page_url(league.settings()['league_id']))
+            input('Press enter once logged in: ')
+            session = session_from_driver(driver)
+            driver.quit()
 
-            next_page_button = driver.find_element_by_link_text('Next 25')
-            next_page_button.click()
-            time.sleep(3)
+        player_projs = fetch_projections(session, league.settings()['league_id'], max_workers=max_workers)
             
         proj_column = []
             
@@ -230,129 +362,361 @@ def create_df(league, load_players=True, save=True, get_projs=True):
         df.sort_values(by=['2020 Projections'], ascending=False, inplace=True)
 
     if save:
-        df.to_csv('player-data/raw_player_data.csv')
+        df.to_csv(PLAYER_DATA_PATH)
     
     return df
 
-def load_df(adjust=True):
-    df = pd.read_csv('player-data/raw_player_data.csv')
+def read_player_csv(path=PLAYER_DATA_PATH):
+    df = pd.read_csv(path)
     # set index to player name
     df.rename(columns={'Unnamed: 0': 'Player ID'}, inplace=True)
     df.set_index('Player ID', inplace=True)
-    if adjust:
-        # wrs
-
-        # dadams
-        df.at[27581, '2020 Projections'] = 235
-        # odell
-        df.at[27540, '2020 Projections'] = 201
-        #amari
-        df.at[28392, '2020 Projections'] = 215
-        # chark
-        df.at[31031, '2020 Projections'] = 207
-        # juju
-        df.at[30175, '2020 Projections'] = 196
-        # sutton
-        df.at[31010, '2020 Projections'] = 205
-        # deebo
-        df.at[31868, '2020 Projections'] = 195
-        # julio
-        df.at[24793, '2020 Projections'] = 230
-        # dj moore
-        df.at[30994, '2020 Projections'] = 209
-        # parker
-        df.at[28402, '2020 Projections'] = 206
-        # terry
-        df.at[31908, '2020 Projections'] = 200
-        # ajb
-        df.at[31883, '2020 Projections'] = 211
-        # thielen
-        df.at[27277, '2020 Projections'] = 208
-        # gallup
-        df.at[31051, '2020 Projections'] = 195
-        # landry
-        df.at[27591, '2020 Projections'] = 175
-        # boyd
-        df.at[29288, '2020 Projections'] = 192
-        # ty
-        df.at[25802, '2020 Projections'] = 203
-        # ajg
-        df.at[24791, '2020 Projections'] = 174
-        # jerry jeudy
-        df.at[32685, '2020 Projections'] = 157
-        # jalen reagor
-        df.at[32691, '2020 Projections'] = 155
-        # brandon aiyuk
-        df.at[32695, '2020 Projections'] = 150
-        # diontae
-        df.at[31898, '2020 Projections'] = 183
-        # anthony miller
-        df.at[31021, '2020 Projections'] = 140
-        # crowder
-        df.at[28493, '2020 Projections'] = 156
-        # ridley
-        df.at[30996, '2020 Projections'] = 205.6
-        # lockett
-        df.at[28457, '2020 Projections'] = 206
-        # mjj
-        df.at[25876, '2020 Projections'] = 158
-
-        # rbs
-
-        # zeke
-        df.at[29238, '2020 Projections'] = 275.00
-        #aaron jones
-        df.at[30295, '2020 Projections'] = 230
-        # clyde edwards
-        df.at[32702, '2020 Projections'] = 210.00
-        # johnathan taylor
-        df.at[32711, '2020 Projections'] = 183
-        # singletary
-        df.at[31906, '2020 Projections'] = 177
-        # fournette
-        df.at[30117, '2020 Projections'] = 200
-        # mostert
-        df.at[28654, '2020 Projections'] = 175
-        # sony
-        df.at[31001, '2020 Projections'] = 162.5
-        # bell
-        df.at[26671, '2020 Projections'] = 185
-        # ingram
-        df.at[24815, '2020 Projections'] = 186
-
-        # tes
-
-        # kittle
-        df.at[30259, '2020 Projections'] = 225
-        # ertz
-        df.at[26658, '2020 Projections'] = 187.5
-        # waller
-        df.at[28592, '2020 Projections'] = 190
-        # hooper
-        df.at[32685, '2020 Projections'] = 130
-        # gesicki
-        df.at[31012, '2020 Projections'] = 152
-        # ertz
-        df.at[26658, '2020 Projections'] = 170
-
-        # qbs
-
-        # kyler
-        df.at[31833, '2020 Projections'] = 355
-        # josh allen
-        df.at[29236, '2020 Projections'] = 325
-        # tannehil
-        df.at[25718, '2020 Projections'] = 300
+    return df
 
-        df.sort_values(by=['2020 Projections'], ascending=False, inplace=True)
+
+def player_cache_signature(path=PLAYER_DATA_PATH, overrides_path=None):
+    # the cache is stale if the csv, the overrides (if applied) or the cache layout changed since it was written
+    stat = os.stat(path)
+    signature = {'version': PLAYER_CACHE_VERSION, 'csv_mtime': stat.st_mtime_ns, 'csv_size': stat.st_size}
+    if overrides_path is not None:
+        signature['overrides_mtime'] = os.stat(overrides_path).st_mtime_ns
+    return signature
+
+
+def write_player_cache(df, signature, cache_dir=os.path.join(PLAYER_CACHE_DIR, 'raw')):
+    """
+    Writes player data as .npy column files that load_player_cache can memory map. All float columns are stored
+    together as one 2D array so the DataFrame can be built on top of it without copying. The files are written to a
+    temporary directory that then replaces cache_dir, so readers never see a partly written cache.
+
+    :param df: A DataFrame from read_player_csv.
+    :param signature: The signature of the csv the data was read from (see player_cache_signature).
+    :param cache_dir: The directory to write the cache to.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=parent, prefix='.cache-')
+    floats = [col for col in df.columns if df[col].dtype == np.float64]
+    others = [col for col in df.columns if col not in floats]
+
+    np.save(os.path.join(temp_dir, 'index.npy'), df.index.to_numpy())
+    np.save(os.path.join(temp_dir, 'floats.npy'), df[floats].to_numpy())
+    for i, col in enumerate(others):
+        values = df[col].to_numpy()
+        if values.dtype == object:
+            values = df[col].fillna('').to_numpy(dtype=str)
+        np.save(os.path.join(temp_dir, f'column{i}.npy'), values)
+
+    meta = dict(signature, index=df.index.name, columns=list(df.columns), floats=floats, others=others,
+                dtypes={col: str(df[col].dtype) for col in df.columns})
+    with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+    # a directory can't be replaced while it has files, so move the old cache out of the way first
+    # readers in between find no cache and fall back to the csv
+    old_dir = tempfile.mkdtemp(dir=parent, prefix='.stale-')
+    try:
+        os.replace(cache_dir, os.path.join(old_dir, 'cache'))
+    except FileNotFoundError:
+        pass
+    try:
+        os.replace(temp_dir, cache_dir)
+    except OSError:
+        # another process put its (equally fresh) cache in place first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def load_player_cache(signature, cache_dir=os.path.join(PLAYER_CACHE_DIR, 'raw')):
+    """
+    Loads player data written by write_player_cache. The index and the float columns are memory mapped
+    copy-on-write, so the file is read lazily and edits to the DataFrame never reach the cache. String columns are
+    converted to Python objects, which copies them.
+
+    :param signature: The signature of the current csv (see player_cache_signature).
+    :param cache_dir: The directory the cache was written to.
+    :return: A DataFrame, or None if the cache is missing, stale or can't be read (e.g. it is being replaced).
+    """
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if any(meta.get(key) != value for key, value in signature.items()):
+        return None
+
+    try:
+        index = pd.Index(np.load(os.path.join(cache_dir, 'index.npy'), mmap_mode='r'), name=meta['index'])
+        floats = np.load(os.path.join(cache_dir, 'floats.npy'), mmap_mode='c')
+        df = pd.DataFrame(floats, index=index, columns=meta['floats'], copy=False)
+        # inserting columns adds new blocks instead of copying the float block
+        for i, col in enumerate(meta['others']):
+            values = np.load(os.path.join(cache_dir, f'column{i}.npy'), mmap_mode='c')
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+            df.insert(meta['columns'].index(col), col, values)
+    except (OSError, ValueError):
+        return None
     return df
 
 
+@functools.lru_cache(maxsize=None)
+def compile_overrides(path, mtime=None):
+    """
+    Compiles a projection overrides file into arrays that can be applied in one assignment.
+
+    :param path: Path to the overrides .json file.
+    :param mtime: Modification time of the file. Only used so the cache is refreshed when the file changes.
+    :return: A tuple of (column, player ID array, value array, name array).
+    """
+    with open(path) as f:
+        overrides = json.load(f)
+    if overrides.get('version') != OVERRIDES_VERSION:
+        raise ValueError(f'{path}: unsupported overrides version {overrides.get("version")}')
+
+    ids = np.array([override['player_id'] for override in overrides['overrides']], dtype=np.int64)
+    values = np.array([override['value'] for override in overrides['overrides']], dtype=float)
+    names = np.array([override.get('name', '') for override in overrides['overrides']], dtype=object)
+
+    unique_ids, counts = np.unique(ids, return_counts=True)
+    if (counts > 1).any():
+        raise ValueError(f'{path}: multiple overrides for player IDs {unique_ids[counts > 1].tolist()}')
+
+    return overrides['column'], ids, values, names
+
+
+def load_overrides(path=OVERRIDES_PATH):
+    return compile_overrides(path, os.stat(path).st_mtime_ns)
+
+
+def apply_overrides(df, overrides):
+    """
+    Applies compiled overrides (see compile_overrides) to a DataFrame from load_df. Players that aren't in the
+    DataFrame are skipped.
+    """
+    column, ids, values, names = overrides
+    rows = df.index.get_indexer(ids)
+    found = rows >= 0
+
+    # catches overrides written against the wrong player ID
+    mismatched = found & (names != '') & (names != df['name'].to_numpy()[rows])
+    for player_id, name in zip(ids[mismatched], names[mismatched]):
+        print(f'Override for {name} is on player ID {player_id} ({df.at[player_id, "name"]}).')
+
+    df.iloc[rows[found], df.columns.get_loc(column)] = values[found]
+
+
+def load_df(adjust=True):
+    """
+    Loads the player data, from the cache if it is up to date. With adjust, the overrides are applied and the
+    players sorted by projection before the data is cached, so loading from the cache copies nothing.
+
+    :param adjust: If True, applies the projection overrides and sorts by projection.
+    :return: A DataFrame indexed by player ID.
+    """
+    signature = player_cache_signature(overrides_path=OVERRIDES_PATH if adjust else None)
+    cache_dir = os.path.join(PLAYER_CACHE_DIR, 'adjusted' if adjust else 'raw')
+    df = load_player_cache(signature, cache_dir)
+    if df is None:
+        df = read_player_csv()
+        if adjust:
+            apply_overrides(df, load_overrides())
+            df.sort_values(by=['2020 Projections'], ascending=False, inplace=True)
+        write_player_cache(df, signature, cache_dir)
+    return df
+
+
+POSITIONS = ['QB', 'RB', 'WR', 'TE', 'K', 'DEF']
+
+STATIC_POSITION_MODS = {'QB': 0.05, 'RB': 1, 'WR': 1, 'TE': 1, 'K': 0.05, 'DEF': 0.05}
+
+
+def position_codes(positions):
+    """
+    Encodes position names as integer codes (indexes into POSITIONS). Unknown positions are coded as -1.
+
+    :param positions: An iterable of position names.
+    :return: A numpy array of position codes.
+    """
+    return pd.Categorical(positions, categories=POSITIONS).codes
+
+
+STARTER, FLEX, BENCH = 0, 1, 2
+
+# position -> multipliers for filling a starting, flex or bench slot (K and DEF are handled in Roster.slot_mod)
+SLOT_MODS = {'QB': (1, 0.9, 0), 'RB': (1, 0.9, 0.1), 'WR': (0.925, 0, 0.1), 'TE': (1, 0.9, 0.05)}
+
+SLOT_ABBREVIATIONS = {'Q': 'QB', 'R': 'RB', 'W': 'WR', 'T': 'TE'}
+
+# the bench is split so rbs and wrs/tes are drafted in balance (see Roster.__init__)
+BENCH_SPLITS = {'BN/RB': ['RB'], 'BN/WR': ['WR', 'TE']}
+
+
+def eligible_positions(slot):
+    """
+    Finds the positions that can fill a roster slot, ex: 'W/R/T' -> ['WR', 'RB', 'TE'].
+
+    :param slot: A slot name from league.positions(), or a bench split from BENCH_SPLITS.
+    :return: A list of position names.
+    """
+    if slot == 'BN':
+        return list(POSITIONS)
+    elif slot in BENCH_SPLITS:
+        return BENCH_SPLITS[slot]
+    elif slot in POSITIONS:
+        return [slot]
+    return [SLOT_ABBREVIATIONS.get(part, part) for part in slot.split('/')]
+
+
+def slot_kind(slot):
+    if slot.startswith('BN'):
+        return BENCH
+    elif len(eligible_positions(slot)) == 1:
+        return STARTER
+    return FLEX
+
+
+def slot_eligibility(slots):
+    """
+    :param slots: A list of slot names.
+    :return: A numpy bool array of shape (positions, slots); True where the position (from POSITIONS) can fill the
+        slot.
+    """
+    eligibility = np.zeros((len(POSITIONS), len(slots)), dtype=bool)
+    for j, slot in enumerate(slots):
+        for pos in eligible_positions(slot):
+            if pos in POSITIONS:
+                eligibility[POSITIONS.index(pos), j] = True
+    return eligibility
+
+
+def assign_slot(assignment, capacities, eligibility, slot_order, code):
+    """
+    Adds a player to a slot assignment, moving other players between slots if that makes room (a breadth first
+    search for an augmenting path, as in bipartite matching).
+
+    :param assignment: A numpy int array of shape (positions, slots) with the number of players at each position in
+        each slot. Modified in place.
+    :param capacities: A numpy array of the number of players each slot holds.
+    :param eligibility: A numpy bool array of shape (positions, slots), see slot_eligibility.
+    :param slot_order: A list or numpy array of slot indexes, in the order they should be tried.
+    :param code: The position code of the player to add.
+    :return: True if the player was added, False if there is no room.
+    """
+    filled = assignment.sum(axis=0)
+    slot_order = np.asarray(slot_order)
+
+    # usually there is an open slot and nobody has to move
+    direct = np.flatnonzero(eligibility[code, slot_order] & (filled[slot_order] < capacities[slot_order]))
+    if len(direct):
+        assignment[code, slot_order[direct[0]]] += 1
+        return True
+
+    # slot -> (slot a player moves out of, position of the player moving in)
+    moves = {}
+    slots_to_check = collections.deque()
+    for slot in slot_order:
+        if eligibility[code, slot]:
+            moves[slot] = (None, code)
+            slots_to_check.append(slot)
+
+    while slots_to_check:
+        slot = slots_to_check.popleft()
+        if filled[slot] < capacities[slot]:
+            while slot is not None:
+                from_slot, pos = moves[slot]
+                assignment[pos, slot] += 1
+                if from_slot is not None:
+                    assignment[pos, from_slot] -= 1
+                slot = from_slot
+            return True
+        for pos in np.flatnonzero(assignment[:, slot]):
+            for next_slot in slot_order:
+                if eligibility[pos, next_slot] and next_slot not in moves:
+                    moves[next_slot] = (slot, pos)
+                    slots_to_check.append(next_slot)
+    return False
+
+
+class SlotCounts:
+    """
+    Number of players filling each roster slot. Indexed by slot name like a dict.
+    """
+
+    __slots__ = ('slots', 'counts')
+
+    def __init__(self, slot_names):
+        """
+        Constructor for SlotCounts. All slots start empty.
+
+        :param slot_names: An iterable of slot names (ex: 'QB', 'W/R/T', 'BN/RB').
+        """
+        self.slots = {slot: i for i, slot in enumerate(slot_names)}
+        self.counts = [0] * len(self.slots)
+
+    def __getitem__(self, slot):
+        return self.counts[self.slots[slot]]
+
+    def __setitem__(self, slot, count):
+        self.counts[self.slots[slot]] = count
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return self.slots.keys()
+
+    def values(self):
+        return list(self.counts)
+
+    def items(self):
+        return zip(self.slots, self.counts)
+
+    def state(self):
+        """
+        :return: A hashable snapshot of the slot counts.
+        """
+        return tuple(self.counts)
+
+    def copy(self):
+        counts = SlotCounts(())
+        counts.slots = self.slots
+        counts.counts = list(self.counts)
+        return counts
+
+
 class Roster:
     
-    def __init__(self, league, positions=None):
-        self.all_players = load_df()
-        self.roster = pd.DataFrame(columns=self.all_players.columns)
+    def __init__(self, league, positions=None, players=None, keepers=None):
+        """
+        Constructor for Roster.
+
+        :param league: A yahoo_fantasy_api League, used for roster positions if positions is None.
+        :param positions: A dict of slot names to slot counts.
+        :param players: A DataFrame from load_df. Never modified, so it can be shared between Rosters; loaded from
+            file if None.
+        :param keepers: A list of player IDs already on the roster (see add_players).
+        """
+        if players is None:
+            players = load_df()
+        self.players = players
+        self.player_ids = players.index.tolist()
+        self.id_array = players.index.to_numpy()
+        self.rows = {player_id: row for row, player_id in enumerate(self.player_ids)}
+        self.names = players['name'].to_numpy()
+        self.position_names = players['position'].to_numpy()
+        self.codes = position_codes(players['position'])
+        self.projections = players['2020 Projections'].to_numpy(dtype=float)
+
+        # available[row] is False once a player is drafted by anyone
+        self.available = np.ones(len(self.player_ids), dtype=bool)
+        self.roster_rows = []
         
         if positions is None:
             self.max_positions = {pos: info['count'] for pos, info in league.positions().items()}
@@ -364,62 +728,107 @@ class Roster:
         else:
             self.max_positions = positions
         
-        self.positions = {pos: 0 for pos in self.max_positions.keys()}
+        self.positions = SlotCounts(self.max_positions)
+
+        # position x slot eligibility, and the number of players at each position in each slot
+        self.slot_names = list(self.max_positions)
+        self.capacities = np.array([self.max_positions[slot] for slot in self.slot_names])
+        self.eligibility = slot_eligibility(self.slot_names)
+        self.slot_kinds = np.array([slot_kind(slot) for slot in self.slot_names])
+        # dedicated slots are tried first, then flex slots (narrowest first), then the bench
+        self.slot_order = np.array(sorted(range(len(self.slot_names)),
+                                          key=lambda slot: (self.slot_kinds[slot], self.eligibility[:, slot].sum())))
+        self.assignment = np.zeros((len(POSITIONS), len(self.slot_names)), dtype=int)
+        self.position_counts = [0] * len(POSITIONS)
+        # position counts -> open positions, see open_positions
+        self.open_cache = {}
         
         self.round = 1
+
+        # slot state -> position multipliers, see position_mods
+        self.mod_cache = {}
+
+        self.build_index()
+
+        if keepers is not None:
+            self.add_players(keepers)
+
+    @property
+    def all_players(self):
+        """
+        DataFrame of available players and their current values, sorted by value. Built on each access.
+        """
+        df = self.players[self.available].copy()
+        df['Value'] = self.values()[self.available]
+        return df.sort_values(by='Value', ascending=False)
+
+    @property
+    def roster(self):
+        """
+        DataFrame of the players on this roster, in the order they were added. Built on each access.
+        """
+        return self.players.iloc[self.roster_rows]
+
+    def is_available(self, player_id):
+        return self.available[self.rows[player_id]]
+
+    def on_roster(self, player_id):
+        return self.rows.get(player_id) in self.roster_rows
         
     def get_position(self, player_id):
-        if player_id in self.roster.index:
-            return self.roster.at[player_id, 'position']
-        else:
-            return self.all_players.at[player_id, 'position']
+        return self.position_names[self.rows[player_id]]
         
     def positions_open(self, player_id):
-        
-        pos = self.get_position(player_id)
-        
-        if pos == 'QB':
-            if self.positions['QB'] < self.max_positions['QB']:
-                return True
-        elif pos == 'RB':
-            if self.positions['RB'] < self.max_positions['RB'] or self.positions['W/R/T'] < self.max_positions['W/R/T']:
-                return True
-            elif self.positions['BN/RB'] < self.max_positions['BN/RB']:
-                return True
-        elif pos == 'WR':
-            if self.positions['WR'] < self.max_positions['WR'] or self.positions['W/R/T'] < self.max_positions['W/R/T']:
-                return True
-            elif self.positions['BN/WR'] < self.max_positions['BN/WR']:
-                return True
-        elif pos == 'TE':
-            if self.positions['TE'] < self.max_positions['TE'] or self.positions['W/R/T'] < self.max_positions['W/R/T']:
-                return True
-            elif self.positions['BN/WR'] < self.max_positions['BN/WR']:
-                return True
-        elif pos == 'K':
-            if self.positions['K'] < self.max_positions['K']:
-                return True
-        elif pos == 'DEF':
-            if self.positions['DEF'] < self.max_positions['DEF']:
-                return True
-        return False
+        code = self.position_code(player_id)
+        return code >= 0 and self.open_positions()[code]
+
+    def position_open(self, pos):
+        return pos in POSITIONS and self.open_positions()[POSITIONS.index(pos)]
+
+    def open_positions(self):
+        """
+        Finds which positions can still be added to the roster, moving players between slots if needed. Cached by
+        the number of players at each position, so this is one lookup per pick.
+
+        :return: A numpy bool array, aligned with POSITIONS.
+        """
+        state = tuple(self.position_counts)
+        is_open = self.open_cache.get(state)
+        if is_open is None:
+            is_open = np.array([
+                assign_slot(self.assignment.copy(), self.capacities, self.eligibility, self.slot_order, code)
+                for code in range(len(POSITIONS))
+            ])
+            self.open_cache[state] = is_open
+        return is_open
+
+    def position_code(self, player_id):
+        return self.codes[self.rows[player_id]]
         
     def fill_positions(self, player_id):
-        
-        pos = self.get_position(player_id)
-        
-        if self.positions[pos] < self.max_positions[pos]:
-            self.positions[pos] += 1
-        elif pos in ['WR', 'RB', 'TE'] and self.positions['W/R/T'] < self.max_positions['W/R/T']:
-            self.positions['W/R/T'] += 1
-        elif pos == 'RB' and self.positions['BN/RB'] < self.max_positions['BN/RB']:
-            self.positions['BN/RB'] += 1
-        elif pos in ['WR', 'TE'] and self.positions['BN/WR'] < self.max_positions['BN/WR']:
-            self.positions['BN/WR'] += 1
-        else: # if there are no slots for player
+        code = self.position_code(player_id)
+        if code < 0 or not assign_slot(self.assignment, self.capacities, self.eligibility, self.slot_order, code):
+            # if there are no slots for player
             return False
+        self.positions.counts = self.assignment.sum(axis=0).tolist()
+        self.position_counts[code] += 1
         return True
     
+    def copy(self):
+        """
+        Copies the draft state of this Roster. Player data and indexes are shared with the original, not copied.
+
+        :return: A new Roster.
+        """
+        roster = copy.copy(self)
+        roster.available = self.available.copy()
+        roster.roster_rows = list(self.roster_rows)
+        roster.positions = self.positions.copy()
+        roster.assignment = self.assignment.copy()
+        roster.position_counts = list(self.position_counts)
+        roster.index_heads = dict(self.index_heads)
+        return roster
+
     def is_full(self):
         for pos, count in self.positions.items():
             if count < self.max_positions[pos]:
@@ -427,129 +836,453 @@ class Roster:
         return True
     
     def draft(self, player_id):
-        player = self.all_players.loc[player_id]
-        player_name = player['name']
-        print(f"Drafted {player_name}.")
+        if not self.is_available(player_id):
+            print(f"{self.names[self.rows[player_id]]} was already taken.")
+            return False
+        print(f"Drafted {self.names[self.rows[player_id]]}.")
         if self.fill_positions(player_id):
-            self.roster = self.roster.append(player) #check this
-            self.all_players.drop(player_id, inplace=True)
+            self.roster_rows.append(self.rows[player_id])
+            self.remove_player(player_id)
             return True
         print('No space for player.')
         return False
               
     def remove_player(self, player_id):
-        self.all_players.drop(player_id, inplace=True)
-              
+        self.available[self.rows[player_id]] = False
+
+    def keep_available(self, player_ids, above=None):
+        """
+        Marks players that aren't in player_ids as taken, in one pass. The board may be filtered (ex: by position)
+        or only render some of its rows, so by default only players ranked above the given player are removed, like
+        when picking by hand: anyone better than our pick who is no longer on the board was drafted.
+
+        :param player_ids: IDs of the players that are still available (ex: the players on the draft board).
+        :param above: A player ID. Only players valued higher than this player are removed. If None, every player
+            missing from player_ids is removed, which is only right if player_ids lists every undrafted player.
+        :return: The number of players removed.
+        """
+        still_available = np.isin(self.id_array, np.fromiter(player_ids, dtype=self.id_array.dtype))
+        removed = self.available & ~still_available
+        if above is not None:
+            values = self.values()
+            removed &= values > values[self.rows[above]]
+        self.available &= ~removed
+        return np.count_nonzero(removed)
+
     def add_to_roster(self, player_id):
+        if not self.is_available(player_id):
+            return False
         if self.fill_positions(player_id):
-            row = self.all_players.loc[player_id]
-            self.roster = self.roster.append(row)
+            self.roster_rows.append(self.rows[player_id])
             self.remove_player(player_id)
             self.round += 1
             return True
         return False
               
+    def add_players(self, player_ids):
+        """
+        Adds many players to the roster at once (ex: keepers, or our picks from before a reconnect). Slots are
+        filled in the order given and the players are removed from the pool in one operation.
+
+        :param player_ids: A list of player IDs.
+        :return: A list of the player IDs that weren't added, because they didn't fit, aren't in the player data,
+            are already taken (ex: keepers that also show up in the draft results) or are repeated in player_ids.
+        """
+        added = []
+        skipped = []
+        for player_id in player_ids:
+            row = self.rows.get(player_id)
+            if row is not None and self.available[row] and row not in added and self.fill_positions(player_id):
+                added.append(row)
+            else:
+                skipped.append(player_id)
+        self.roster_rows.extend(added)
+        self.available[added] = False
+        self.round += len(added)
+        return skipped
+
+    def remove_players(self, player_ids):
+        """
+        Removes many players from the pool at once. Players that aren't in the player data are ignored.
+
+        :param player_ids: A list of player IDs.
+        """
+        self.available[[self.rows[player_id] for player_id in player_ids if player_id in self.rows]] = False
+
+    def restore(self, league):
+        """
+        Rebuilds the draft state from the league's draft results so far, ex: after a crash or disconnect. Should
+        be called on a Roster that hasn't drafted yet.
+
+        :param league: A yahoo_fantasy_api League with a draft in progress.
+        :return: A list of our drafted player IDs that couldn't be added (see add_players).
+        """
+        results = league.draft_results()
+        team_key = league.team_key()
+        skipped = self.add_players([int(pick['player_id']) for pick in results if pick['team_key'] == team_key])
+        self.remove_players([int(pick['player_id']) for pick in results])
+        return skipped
+
     def remove_best(self):
-        self.all_players.drop(self.all_players.iloc[0].name, inplace=True)
+        self.remove_player(self.get_best_player())
     
     def static_position_mod(self, player_id):
-        pos = self.get_position(player_id)
-        if pos == 'QB':
-            return 0.05
-        elif pos == 'RB':
-            return 1
-        elif pos == 'WR':
-            return 1
-        elif pos == 'TE':
-            return 1
-        elif pos == 'K':
-            return 0.05
-        elif pos == 'DEF':
-            return 0.05
+        return STATIC_POSITION_MODS.get(self.get_position(player_id))
               
     def dynamic_position_mod(self, player_id):
-        pos = self.get_position(player_id)
-        
-        if pos == 'RB':
-            # best available until rb slots filled
-            if self.positions['RB'] < self.max_positions['RB']:
-                return 1
-            elif self.positions['W/R/T'] < self.max_positions['W/R/T']:
-                return 0.9
-            elif self.positions['BN/RB'] < self.max_positions['BN/RB']:
-                if self.positions['BN/RB'] <= 2:
-                    return 0.125
-                return 0.1
-            else:
-                return 0
-        elif pos == 'WR':
-            if self.positions['WR'] < self.max_positions['WR']:
-                return 0.925
-            elif self.positions['W/R/T'] < self.max_positions['W/R/T']:
-                return 0 # fill flex w/ rb
-            elif self.positions['BN/WR'] < self.max_positions['BN/WR']:
-                return 0.1
-            else:
-                return 0
-        elif pos == 'TE':
-            if self.positions['TE'] < self.max_positions['TE']:
-                return 1
-            elif self.positions['W/R/T'] < self.max_positions['W/R/T']:
-                return 0.9
-            elif self.positions['BN/WR'] < self.max_positions['BN/WR']:
-                return 0.05
-            else:
-                return 0
-        elif pos == 'QB':
-            if self.positions['QB'] < self.max_positions['QB']:
-                return 1
-            else:
-                return 0
-        elif pos == 'K' or pos == 'DEF':
-            for slot in ['QB', 'RB', 'WR', 'TE', 'W/R/T', 'BN/RB', 'BN/WR']:
-                if self.positions[slot] < self.max_positions[slot]:
-                    return 0
-            return 1
-        else:
+        return self.slot_mod(self.get_position(player_id))
+
+    def slot_mod(self, pos):
+        if pos not in POSITIONS:
             return 1
+        code = POSITIONS.index(pos)
+        has_room = np.array(self.positions.counts) < self.capacities
+
+        if pos == 'K' or pos == 'DEF':
+            # only once every slot that can't take a kicker or defense is filled
+            other_slots = ~self.eligibility[POSITIONS.index('K')] & ~self.eligibility[POSITIONS.index('DEF')]
+            return 0 if (has_room & other_slots).any() else 1
+
+        # value of the best kind of slot the player would fill
+        starter_mod, flex_mod, bench_mod = SLOT_MODS[pos]
+        open_slots = has_room & self.eligibility[code]
+        if (open_slots & (self.slot_kinds == STARTER)).any():
+            return starter_mod
+        elif (open_slots & (self.slot_kinds == FLEX)).any():
+            return flex_mod
+        elif (open_slots & (self.slot_kinds == BENCH)).any():
+            # slightly favor the first few bench rbs
+            if pos == 'RB' and np.array(self.positions.counts)[open_slots].min() <= 2:
+                return 0.125
+            return bench_mod
+        return 0
         
     def te_hack_mod(self):
-        if 26686 in self.roster.index and self.round == 3:
-            self.all_players.at[30259, 'Value'] = 100000
-            
-    def set_value(self):
-              
-        self.all_players['Value'] = self.all_players['2020 Projections']
-        
-        self.all_players['Value'] *= self.all_players.index.map(self.static_position_mod)
-        self.all_players['Value'] *= self.all_players.index.map(self.dynamic_position_mod)
-        
-        self.te_hack_mod()
-        
-        self.all_players.sort_values(by='Value', ascending=False, inplace=True)
+        # returns values that override the normal valuation, by player id
+        if self.on_roster(26686) and self.round == 3:
+            return {30259: 100000}
+        return {}
+
+    def build_index(self):
+        # position code -> (rows, projections), sorted by projection
+        # every player at a position shares the same multiplier, so this order never changes:
+        # only the first player still available at each position can be the best pick
+        self.position_index = {}
+        self.index_heads = {}
+        order = np.argsort(-self.projections, kind='stable')
+        for code in np.unique(self.codes).tolist():
+            rows = order[self.codes[order] == code]
+            self.position_index[code] = (rows, self.projections[rows])
+            self.index_heads[code] = 0
+
+    def index_head(self, code):
+        # skips past taken players; amortized O(1) since heads only move forward
+        rows = self.position_index[code][0]
+        head = self.index_heads[code]
+        while head < len(rows) and not self.available[rows[head]]:
+            head += 1
+        self.index_heads[code] = head
+        return head
+
+    def ranked_players(self):
+        """
+        Lazily yields available player IDs in order of value, merging the per-position indexes.
+        """
+        mods = self.position_mods()
+        overrides = {player_id: value for player_id, value in self.te_hack_mod().items()
+                     if self.is_available(player_id)}
+
+        def position_stream(code):
+            rows, projections = self.position_index[code]
+            for i in range(self.index_head(code), len(rows)):
+                player_id = self.player_ids[rows[i]]
+                if self.available[rows[i]] and player_id not in overrides:
+                    yield -projections[i] * mods[code], player_id
+
+        streams = [position_stream(code) for code in self.position_index]
+        streams.append(sorted((-value, player_id) for player_id, value in overrides.items()))
+        for _, player_id in heapq.merge(*streams):
+            yield player_id
+
+    def best_available(self):
+        """
+        Finds the most valuable available player that fits in an open slot. Only looks at the head of each
+        position's index.
+
+        :return: A player ID, or None if no available player can be added.
+        """
+        mods = self.position_mods()
+        best_id, best_value = None, -np.inf
+        for player_id, value in self.te_hack_mod().items():
+            if self.is_available(player_id) and self.positions_open(player_id) and value > best_value:
+                best_id, best_value = player_id, value
+        open_positions = self.open_positions()
+        for code, (rows, projections) in self.position_index.items():
+            if code < 0 or not open_positions[code]:
+                continue
+            head = self.index_head(code)
+            if head < len(rows) and projections[head] * mods[code] > best_value:
+                best_id, best_value = self.player_ids[rows[head]], projections[head] * mods[code]
+        return best_id
+
+    def position_mods(self):
+        # one multiplier per position code, cached by slot state (only changes when a slot is filled)
+        # the extra last entry is picked up by unknown positions (code -1)
+        state = self.positions.state()
+        mods = self.mod_cache.get(state)
+        if mods is None:
+            mods = [STATIC_POSITION_MODS[pos] * self.slot_mod(pos) for pos in POSITIONS]
+            mods = np.array(mods + [0], dtype=float)
+            self.mod_cache[state] = mods
+        return mods
+
+    def values(self):
+        """
+        :return: A numpy array of every player's current value, aligned with self.players.
+        """
+        values = self.projections * self.position_mods()[self.codes]
+        for player_id, value in self.te_hack_mod().items():
+            if player_id in self.rows:
+                values[self.rows[player_id]] = value
+        return values
     
     def get_best_player(self, n=0):
-        self.set_value()
-        
         # returns index
-        return self.all_players.iloc[n].name
+        return next(itertools.islice(self.ranked_players(), n, None), None)
               
     def get_ids(self):
-        self.set_value()
-              
         # returns list of indexes
-        return self.all_players.index.tolist()
+        return list(self.ranked_players())
     
-    def autodraft(self):
-        player = self.get_best_player()
-        i = 1
-        while not self.draft(player):
-            player = self.get_best_player(i)
-            i += 1
+    def autodraft(self, simulator=None, opponents=None, pick=None):
+        """
+        Drafts the best available player.
+
+        :param simulator: A draftsim.DraftSimulator. If given, picks the player with the highest expected season
+            points over simulated drafts instead of the highest value.
+        :param opponents: For the simulator: the other teams' players so far (see draftsim.draft_state).
+        :param pick: For the simulator: the number of our current pick overall (see draftsim.draft_state).
+        :return: The drafted player's ID, or None if no player can be added.
+        """
+        if simulator is None:
+            player = self.best_available()
+        else:
+            player = simulator.best_pick(self, opponents=opponents, pick=pick)
+        if player is not None:
+            self.draft(player)
         return player
 
 
-def draft_team(league, mock=False):
+# resolves once the element matching arguments[0] exists and (if arguments[1] isn't null) has that text
+# with arguments[2] true, resolves once that stops being the case instead
+# checks again on every DOM change; resolves false after arguments[3] ms so observers don't pile up
+WAIT_FOR_ELEMENT_SCRIPT = """
+const [selector, text, negate, timeout, done] = arguments;
+const check = () => {
+    const element = document.querySelector(selector);
+    const matched = element !== null && (text === null || element.textContent.trim() === text);
+    return negate ? !matched : matched;
+};
+if (check()) {
+    done(true);
+    return;
+}
+const observer = new MutationObserver(() => {
+    if (check()) {
+        observer.disconnect();
+        clearTimeout(timer);
+        done(true);
+    }
+});
+const timer = setTimeout(() => {
+    observer.disconnect();
+    done(false);
+}, timeout);
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+"""
+
+
+def board_player_ids(driver):
+    """
+    Gets the IDs of all players on the draft board with one script call.
+
+    :param driver: A selenium webdriver object on the draft page.
+    :return: A list of player IDs.
+    """
+    player_ids = driver.execute_script(
+        "return Array.from(document.querySelectorAll('tr[data-id]'), row => row.getAttribute('data-id'));"
+    )
+    return [int(player_id) for player_id in player_ids if player_id.isnumeric()]
+
+
+# resolves with our turn status and the IDs on the board once it is our turn or the board's row count changes
+WAIT_FOR_PICK_SCRIPT = """
+const [rowCount, turnText, timeout, done] = arguments;
+const snapshot = () => {
+    const turnElement = document.querySelector('#draft-now');
+    const rows = document.querySelectorAll('tr[data-id]');
+    const turn = turnElement !== null && turnElement.textContent.trim() === turnText;
+    if (!turn && rows.length === rowCount) {
+        return null;
+    }
+    return {turn: turn, ids: Array.from(rows, row => row.getAttribute('data-id'))};
+};
+const result = snapshot();
+if (result !== null) {
+    done(result);
+    return;
+}
+const observer = new MutationObserver(() => {
+    const result = snapshot();
+    if (result !== null) {
+        observer.disconnect();
+        clearTimeout(timer);
+        done(result);
+    }
+});
+const timer = setTimeout(() => {
+    observer.disconnect();
+    done(null);
+}, timeout);
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+"""
+
+
+class TurnDetector:
+    """
+    Waits for changes on the draft page by injecting a MutationObserver, so the bot reacts as soon as the page
+    updates instead of on the next poll.
+    """
+
+    TURN_TEXT = "It's your turn to draft!"
+
+    def __init__(self, driver, timeout=60):
+        """
+        Constructor for TurnDetector.
+
+        :param driver: A selenium webdriver object on the draft page.
+        :param timeout: Seconds each injected observer waits before it is replaced by a new one.
+        """
+        self.driver = driver
+        self.timeout = timeout
+        self.driver.set_script_timeout(timeout + 5)
+
+    def wait_for(self, selector, text=None, negate=False):
+        while not self.driver.execute_async_script(WAIT_FOR_ELEMENT_SCRIPT, selector, text, negate,
+                                                   self.timeout * 1000):
+            pass
+
+    def wait_for_start(self):
+        self.wait_for('.ys-player')
+
+    def wait_for_turn_end(self):
+        self.wait_for('#draft-now', self.TURN_TEXT, negate=True)
+
+    def wait_for_turn_or_pick(self, row_count):
+        """
+        Waits until our turn begins or another team makes a pick (the number of players on the board changes).
+
+        :param row_count: The number of players on the board when last checked.
+        :return: True if it is our turn, and the IDs of the players on the board.
+        """
+        while True:
+            result = self.driver.execute_async_script(WAIT_FOR_PICK_SCRIPT, row_count, self.TURN_TEXT,
+                                                      self.timeout * 1000)
+            if result is not None:
+                return result['turn'], [int(player_id) for player_id in result['ids'] if player_id.isnumeric()]
+
+
+class Lookahead:
+    """
+    Re-ranks a shortlist of picks in a background thread every time another team picks, so that on our turn the
+    pick is just the first shortlisted player still on the board.
+    """
+
+    def __init__(self, roster, size=10):
+        """
+        Constructor for Lookahead. Starts the background thread.
+
+        :param roster: The Roster to pick for. Only changed through this object while it is running.
+        :param size: The number of players to keep on the shortlist.
+        """
+        self.roster = roster
+        self.size = size
+        self.shortlist = []
+        self.lock = threading.Lock()
+        self.snapshots = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def rank(self, board):
+        """
+        :param board: A set of the IDs of the players on the board.
+        :return: The top legal players that are on the board.
+        """
+        legal = (player_id for player_id in self.roster.ranked_players()
+                 if player_id in board and self.roster.positions_open(player_id))
+        return list(itertools.islice(legal, self.size))
+
+    def run(self):
+        while True:
+            board_ids = self.snapshots.get()
+            # only the newest snapshot matters if several picks came in at once
+            while board_ids is not None and not self.snapshots.empty():
+                board_ids = self.snapshots.get()
+            if board_ids is None:
+                return
+            with self.lock:
+                self.shortlist = self.rank(set(board_ids))
+
+    def observe(self, board_ids):
+        """
+        Queues a snapshot of the draft board for the background thread.
+
+        :param board_ids: IDs of the players on the board.
+        """
+        self.snapshots.put(board_ids)
+
+    def pick(self, board_ids):
+        """
+        Picks the first shortlisted player that is still on the board. Falls back to the best ranked legal player on
+        the board if none of them are. Nothing is changed until the pick is confirmed.
+
+        :param board_ids: IDs of the players on the board.
+        :return: The picked player's ID, or None if no player on the board fits.
+        """
+        board = set(board_ids)
+        with self.lock:
+            player_id = next((player_id for player_id in self.shortlist
+                              if player_id in board and self.roster.positions_open(player_id)), None)
+            if player_id is None:
+                player_id = next(iter(self.rank(board)), None)
+        return player_id
+
+    def confirm(self, player_id, board_ids):
+        """
+        Adds a drafted player to the roster and re-ranks the shortlist. Players ranked above them who are gone from
+        the board are marked as taken.
+
+        :param player_id: The ID of the player that was drafted (from pick).
+        :param board_ids: IDs of the players on the board when the player was picked.
+        """
+        with self.lock:
+            self.roster.keep_available(board_ids, above=player_id)
+            self.roster.add_to_roster(player_id)
+            self.shortlist = self.rank(set(board_ids) - {player_id})
+
+    def stop(self):
+        self.snapshots.put(None)
+
+
+def draft_team(league, mock=False, keepers=None, resume=False):
+    """
+    Drafts a team in a live (or mock) draft on Yahoo.
+
+    :param league: A yahoo_fantasy_api League.
+    :param mock: If True, joins a mock draft instead of the league's draft.
+    :param keepers: A list of player IDs already on our roster.
+    :param resume: If True, picks up the league's draft where it is (ex: after a crash) using its draft results.
+    """
     driver = webdriver.Chrome(os.path.join(os.getcwd(), 'chromedriver'))
     base_url = f'https://football.fantasysports.yahoo.com/f1/{league.settings()["league_id"]}/'
     if mock:
@@ -586,13 +1319,8 @@ def draft_team(league, mock=False):
 
     driver.switch_to.window(driver.window_handles[-1])
 
-    draft_started = False
-    while not draft_started:
-        try:
-            draft_started_detector = driver.find_element_by_class_name('ys-player')
-            draft_started = True
-        except NoSuchElementException:
-            time.sleep(10)
+    detector = TurnDetector(driver)
+    detector.wait_for_start()
 
     print('Draft started.')
 
@@ -606,40 +1334,48 @@ def draft_team(league, mock=False):
 
     time.sleep(2)
 
-    roster = Roster(league)
-    
-    # add keepers here
-
-    while not roster.is_full():
-
-        my_turn = False
-        while not my_turn:
-            turn_indicator = driver.find_element_by_id('draft-now').text
-            if turn_indicator == "It's your turn to draft!":
-                print('Your turn.')
-                my_turn = True
+    roster = Roster(league, keepers=keepers)
+    if resume:
+        roster.restore(league)
 
-            time.sleep(3)
+    # keeps a shortlist ranked in the background while the other teams are on the clock
+    lookahead = Lookahead(roster)
+    board_ids = board_player_ids(driver)
+    lookahead.observe(board_ids)
 
-        for player_id in roster.get_ids():
-            try:
-                player = driver.find_element_by_css_selector(f'tr[data-id="{player_id}"]')
-                if roster.positions_open(player_id):
-                    print(roster.positions)
-                    print(roster.max_positions)
-                    roster.add_to_roster(player_id)
-                    break
-            except NoSuchElementException:
-                roster.remove_player(player_id)
+    while not roster.is_full():
+        my_turn, board_ids = detector.wait_for_turn_or_pick(len(board_ids))
+        if not my_turn:
+            lookahead.observe(board_ids)
+            continue
 
-        player.click()
+        print('Your turn.')
+        print(roster.positions)
+        print(roster.max_positions)
+        player_id = lookahead.pick(board_ids)
+        if player_id is None:
+            print('No player on the board fits the roster. Finish the draft by hand.')
+            break
 
-        time.sleep(2)
+        try:
+            player = driver.find_element_by_css_selector(f'tr[data-id="{player_id}"]')
+            player.click()
+
+            draft_button = WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, '.Btn.ys-can-draft.ys-draft-player'))
+            )
+            draft_button.click()
+        except (NoSuchElementException, StaleElementReferenceException, TimeoutException):
+            # nothing is added to the roster; with no row count the next wait returns right away with a fresh board
+            print(f'Could not draft {roster.names[roster.rows[player_id]]}, retrying.')
+            board_ids = []
+            continue
 
-        draft_button = driver.find_element_by_css_selector('.Btn.ys-can-draft.ys-draft-player')
-        draft_button.click()
+        lookahead.confirm(player_id, board_ids)
+        detector.wait_for_turn_end()
+        board_ids = board_player_ids(driver)
 
-        time.sleep(5)
+    lookahead.stop()
 
     print('Draft complete.')
 
@@ -0,0 +1,298 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from drafterbot import BENCH, POSITIONS, Roster, assign_slot, position_codes
+
+# set up once per worker process by init_worker
+worker_template = None
+worker_buffers = []
+
+
+def share_array(array):
+    """
+    Copies an array into a new shared memory block.
+
+    :param array: A numpy array.
+    :return: The SharedMemory object (owned by the caller) and a picklable spec for attach_array.
+    """
+    buffer = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=buffer.buf)[:] = array
+    return buffer, (buffer.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec):
+    """
+    Opens an array created by share_array. The array is read directly from shared memory.
+
+    :param spec: The spec returned by share_array.
+    :return: A numpy array.
+    """
+    name, shape, dtype = spec
+    buffer = shared_memory.SharedMemory(name=name)
+    # keep the buffer open for as long as the worker lives
+    worker_buffers.append(buffer)
+    return np.ndarray(shape, dtype=dtype, buffer=buffer.buf)
+
+
+def players_from_arrays(ids, codes, projections):
+    """
+    Builds the minimal player DataFrame that Roster needs from the shared arrays.
+    """
+    positions = np.array(POSITIONS + [''], dtype=object)[codes]
+    return pd.DataFrame({'name': ids.astype(str), 'position': positions, '2020 Projections': projections},
+                        index=pd.Index(ids, name='Player ID'))
+
+
+def init_worker(specs, max_positions):
+    global worker_template
+    ids, codes, projections = (attach_array(spec) for spec in specs)
+    worker_template = Roster(None, positions=max_positions, players=players_from_arrays(ids, codes, projections))
+
+
+def snake_order(n_teams, n_rounds):
+    """
+    :return: A list of team numbers (0 to n_teams - 1) in the order they pick.
+    """
+    order = []
+    for i in range(n_rounds):
+        teams = range(n_teams) if i % 2 == 0 else reversed(range(n_teams))
+        order.extend(teams)
+    return order
+
+
+def lineup_points(roster):
+    """
+    Sums the projections of the best starting lineup (all non-bench slots) that can be made from a roster.
+    """
+    # filling greedily by projection is optimal here, since lineups that fit form a matroid
+    capacities = np.where(roster.slot_kinds == BENCH, 0, roster.capacities)
+    lineup = np.zeros_like(roster.assignment)
+    points = 0
+    for row in sorted(roster.roster_rows, key=lambda row: -roster.projections[row]):
+        code = roster.codes[row]
+        if code >= 0 and assign_slot(lineup, capacities, roster.eligibility, roster.slot_order, code):
+            points += roster.projections[row]
+    return points
+
+
+def set_roster_state(roster, roster_rows, assignment):
+    """
+    Puts a copied Roster into a draft state: the rows of its players and their slot assignment.
+    """
+    roster.roster_rows = list(roster_rows)
+    roster.assignment = assignment.copy()
+    roster.positions.counts = assignment.sum(axis=0).tolist()
+    roster.position_counts = assignment.sum(axis=1).tolist()
+
+
+def roster_state(template, player_ids):
+    """
+    Works out the draft state of a team from its players, ignoring whether they're still available (they usually
+    aren't, since the team already has them).
+
+    :param template: An empty Roster.
+    :param player_ids: A list of the team's player IDs. Players that aren't in the player data or don't fit are
+        left out.
+    :return: A tuple of (roster rows, slot assignment).
+    """
+    roster = template.copy()
+    for player_id in dict.fromkeys(player_ids):
+        if player_id in roster.rows and roster.fill_positions(player_id):
+            roster.roster_rows.append(roster.rows[player_id])
+    return roster.roster_rows, roster.assignment
+
+
+def draft_state(league):
+    """
+    Reads the other teams' players and the next pick number from a league's draft results. Keepers count as picks,
+    as they do on Yahoo.
+
+    :param league: A yahoo_fantasy_api League with a draft in progress.
+    :return: A dict of draft positions (starting from 0) to lists of player IDs for every other team, and the
+        number of the next pick overall (starting from 0).
+    """
+    results = [pick for pick in league.draft_results() if pick.get('player_id')]
+    positions = {pick['team_key']: int(pick['pick']) - 1 for pick in results if int(pick['round']) == 1}
+    team_key = league.team_key()
+    opponents = {}
+    for pick in results:
+        if pick['team_key'] != team_key and pick['team_key'] in positions:
+            opponents.setdefault(positions[pick['team_key']], []).append(int(pick['player_id']))
+    return opponents, len(results)
+
+
+def opponent_pick(opponent):
+    # greedy on the opponent's own (noisy) values, restricted to positions it still has room for
+    open_codes = np.append(opponent.open_positions(), False)
+    values = np.where(opponent.available & open_codes[opponent.codes], opponent.values(), -np.inf)
+    row = values.argmax()
+    if values[row] == -np.inf:
+        return None
+    return opponent.player_ids[row]
+
+
+def simulate_draft(template, state, candidate, n_teams, draft_position, noise, rng):
+    """
+    Plays out the rest of a snake draft after taking a candidate player.
+
+    :param template: An empty Roster to copy for every team.
+    :param state: Tuple of (availability mask, our roster rows, our slot assignment, the other teams' states as a
+        dict of draft positions to (roster rows, slot assignment), the number of our current pick overall).
+    :param candidate: The player ID we take with our current pick.
+    :param n_teams: Number of teams in the draft.
+    :param draft_position: Our pick number in the first round, starting from 0.
+    :param noise: Standard deviation of the multiplicative noise applied to each opponent's projections.
+    :param rng: A numpy Generator.
+    :return: Our final starting lineup's projected points.
+    """
+    available, roster_rows, assignment, opponent_states, pick = state
+    ours = template.copy()
+    ours.available[:] = available
+    set_roster_state(ours, roster_rows, assignment)
+
+    # all teams share one availability mask
+    opponents = {}
+    for team in range(n_teams):
+        if team != draft_position:
+            opponent = template.copy()
+            opponent.available = ours.available
+            if team in opponent_states:
+                set_roster_state(opponent, *opponent_states[team])
+            opponent.projections = template.projections * rng.lognormal(0, noise, len(template.projections))
+            opponents[team] = opponent
+
+    order = snake_order(n_teams, sum(ours.max_positions.values()))
+
+    ours.add_to_roster(candidate)
+    for team in order[pick + 1:]:
+        if team == draft_position:
+            player = ours.best_available()
+            if player is not None:
+                ours.add_to_roster(player)
+        else:
+            player = opponent_pick(opponents[team])
+            if player is not None:
+                opponents[team].add_to_roster(player)
+
+    return lineup_points(ours)
+
+
+def run_simulations(task):
+    state, candidate, n_sims, n_teams, draft_position, noise, seed = task
+    rng = np.random.default_rng(seed)
+    points = [simulate_draft(worker_template, state, candidate, n_teams, draft_position, noise, rng)
+              for _ in range(n_sims)]
+    return candidate, points
+
+
+class DraftSimulator:
+    """
+    Evaluates draft picks by simulating the rest of a snake draft many times over a pool of worker processes.
+    Opponents draft greedily on noisy projections; we draft with Roster.best_available after the candidate pick.
+    """
+
+    def __init__(self, players, max_positions, n_teams, draft_position, n_sims=1000, noise=0.15, workers=None):
+        """
+        Constructor for DraftSimulator. Starts the worker processes, which read player data from shared memory.
+
+        :param players: A DataFrame from load_df.
+        :param max_positions: A dict of slot names to slot counts (see Roster.max_positions).
+        :param n_teams: Number of teams in the draft.
+        :param draft_position: Our pick number in the first round, starting from 0.
+        :param n_sims: Number of simulated drafts per candidate pick.
+        :param noise: Standard deviation of the multiplicative noise applied to opponents' projections.
+        :param workers: Number of worker processes. Defaults to the number of CPUs.
+        """
+        self.n_teams = n_teams
+        self.draft_position = draft_position
+        self.n_sims = n_sims
+        self.noise = noise
+        self.workers = workers or os.cpu_count() or 1
+
+        arrays = [
+            players.index.to_numpy(dtype=np.int64),
+            position_codes(players['position']),
+            players['2020 Projections'].to_numpy(dtype=float),
+        ]
+        # the same empty roster the workers use, for working out the other teams' states
+        self.template = Roster(None, positions=max_positions, players=players_from_arrays(*arrays))
+        shared = [share_array(array) for array in arrays]
+        self.buffers = [buffer for buffer, _ in shared]
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=([spec for _, spec in shared], max_positions))
+
+    def candidates(self, roster, n=5):
+        """
+        :return: The n highest valued available players that fit on the roster.
+        """
+        legal = (player_id for player_id in roster.ranked_players() if roster.positions_open(player_id))
+        return list(itertools.islice(legal, n))
+
+    def evaluate(self, roster, candidates=None, seed=None, opponents=None, pick=None):
+        """
+        Simulates the rest of the draft for each candidate pick.
+
+        :param roster: Our Roster, in its current draft state.
+        :param candidates: A list of player IDs to evaluate. Defaults to the top 5 legal players by value.
+        :param seed: Seed for the simulations' random number generators.
+        :param opponents: A dict of the other teams' draft positions (starting from 0) to lists of their player IDs
+            so far (see draft_state). Teams left out start empty.
+        :param pick: The number of our current pick overall, starting from 0 (see draft_state). Defaults to our
+            pick in the round after the one of our last roster player, which is wrong if we have keepers.
+        :return: A DataFrame indexed by candidate player ID, with the distribution of our lineup's projected points,
+            sorted by mean.
+        """
+        if candidates is None:
+            candidates = self.candidates(roster)
+        if pick is None:
+            order = snake_order(self.n_teams, sum(roster.max_positions.values()))
+            pick = [i for i, team in enumerate(order) if team == self.draft_position][len(roster.roster_rows)]
+        opponent_states = {team: roster_state(self.template, player_ids)
+                           for team, player_ids in (opponents or {}).items()}
+        state = (roster.available, roster.roster_rows, roster.assignment, opponent_states, pick)
+
+        # split each candidate's simulations into one chunk per worker
+        chunks = [len(chunk) for chunk in np.array_split(np.arange(self.n_sims), self.workers) if len(chunk)]
+        seeds = np.random.SeedSequence(seed).spawn(len(candidates) * len(chunks))
+        tasks = [(state, candidate, chunk, self.n_teams, self.draft_position, self.noise, seeds.pop())
+                 for candidate in candidates for chunk in chunks]
+
+        points = {candidate: [] for candidate in candidates}
+        for candidate, chunk_points in self.executor.map(run_simulations, tasks):
+            points[candidate] += chunk_points
+
+        results = pd.DataFrame({candidate: pd.Series(pts).describe(percentiles=[0.1, 0.5, 0.9])
+                                for candidate, pts in points.items()}).T
+        results.insert(0, 'name', [roster.names[roster.rows[candidate]] for candidate in results.index])
+        return results.sort_values(by='mean', ascending=False)
+
+    def best_pick(self, roster, opponents=None, pick=None):
+        """
+        :param opponents: The other teams' players so far (see evaluate).
+        :param pick: The number of our current pick overall (see evaluate).
+        :return: The candidate player ID with the highest expected lineup points, or None if no player fits.
+        """
+        candidates = self.candidates(roster)
+        if len(candidates) == 0:
+            return None
+        return self.evaluate(roster, candidates, opponents=opponents, pick=pick).index[0]
+
+    def shutdown(self):
+        """
+        Stops the worker processes and frees the shared player data.
+        """
+        self.executor.shutdown()
+        for buffer in self.buffers:
+            buffer.close()
+            buffer.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -1,4 +1,10 @@
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime
 from getpass import getpass
+from urllib.parse import urlparse
 
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException
@@ -8,6 +14,162 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+# the team notes' HTML, and every link in each note (notes may also link teams or players; notifications may have
+# no links at all)
+TEAM_NOTES_SCRIPT = """
+const notes = document.getElementById('teamnotes');
+if (notes === null) {
+    return ['', []];
+}
+return [notes.innerHTML, Array.from(notes.querySelectorAll(':scope > div > div'),
+                                    note => Array.from(note.querySelectorAll('a[href]'), anchor => anchor.href))];
+"""
+
+TRANSACTION_TYPES = ['trade', 'waiver']
+
+# (start hour, end hour, min interval, max interval): poll slowly overnight
+NIGHT_PROFILE = [(1, 8, 60, 1800)]
+
+
+def transaction_type(url):
+    """
+    Classifies a transaction from its URL (e.g. .../viewtrade?... or .../viewwaiver?...).
+
+    :param url: A transaction URL.
+    :return: One of TRANSACTION_TYPES, or None if the URL isn't a known transaction.
+    """
+    page = urlparse(url).path.rstrip('/').split('/')[-1].lower()
+    for kind in TRANSACTION_TYPES:
+        if kind in page:
+            return kind
+    return None
+
+
+class Poller:
+    """
+    Decides how long to wait between polls. Right after activity, polls come quickly; each idle poll after that
+    waits longer (exponential backoff with jitter) up to a maximum. The intervals can depend on the time of day.
+    """
+
+    def __init__(self, min_interval=5, max_interval=300, factor=2, jitter=0.2, fast_polls=5, profiles=None):
+        """
+        Constructor for Poller.
+
+        :param min_interval: The number of seconds between polls right after activity.
+        :param max_interval: The longest wait between polls, in seconds.
+        :param factor: How much the interval grows with each idle poll.
+        :param jitter: The fraction by which each wait is randomly lengthened or shortened.
+        :param fast_polls: The number of polls at min_interval after activity, before backing off.
+        :param profiles: A list of (start hour, end hour, min interval, max interval) tuples, used instead of
+            min_interval and max_interval during their hours (e.g. NIGHT_PROFILE). The first match is used.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.fast_polls = fast_polls
+        self.profiles = profiles or []
+        self.idle_polls = 0
+
+    def bounds(self, now=None):
+        """
+        :return: The min and max intervals for the current time of day.
+        """
+        hour = (now or datetime.now()).hour
+        for start, end, min_interval, max_interval in self.profiles:
+            if start <= hour < end:
+                return min_interval, max_interval
+        return self.min_interval, self.max_interval
+
+    def interval(self):
+        """
+        :return: The number of seconds until the next poll, before jitter.
+        """
+        min_interval, max_interval = self.bounds()
+        backoff = max(self.idle_polls - self.fast_polls, 0)
+        return min(min_interval * self.factor ** backoff, max_interval)
+
+    def activity(self):
+        """
+        Records that the last poll found something, so the next few polls come quickly.
+        """
+        self.idle_polls = 0
+
+    def idle(self):
+        """
+        Records that the last poll found nothing.
+        """
+        self.idle_polls += 1
+
+    def wait(self):
+        """
+        Sleeps until the next poll.
+
+        :return: The number of seconds slept.
+        """
+        interval = self.interval() * random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(interval)
+        return interval
+
+
+class TabPool:
+    """
+    Loads pages in parallel browser tabs of one logged-in driver. The tabs load concurrently, so reading a batch of
+    pages takes about as long as the slowest one. The driver itself can only do one thing at a time, so every use of
+    it (reads through map, actions like sending or cancelling through run) holds the same lock.
+    """
+
+    def __init__(self, driver, size=6):
+        """
+        Constructor for TabPool.
+
+        :param driver: A selenium webdriver object.
+        :param size: The most tabs open at once.
+        """
+        self.driver = driver
+        self.size = size
+        self.lock = threading.RLock()
+
+    def map(self, urls, parse):
+        """
+        Opens each URL in its own tab and parses it once loaded.
+
+        :param urls: A list of URLs.
+        :param parse: A function taking the driver (switched to a loaded tab) and the tab's URL, returning a result.
+        :return: A list of parse's results, in the same order as urls.
+        """
+        results = []
+        with self.lock:
+            main_window = self.driver.current_window_handle
+            try:
+                for start in range(0, len(urls), self.size):
+                    batch = urls[start:start + self.size]
+                    names = [f'ffbot-tab-{i}' for i in range(len(batch))]
+                    # start every load before reading any of them
+                    for name, url in zip(names, batch):
+                        self.driver.execute_script('window.open(arguments[0], arguments[1]);', url, name)
+                    for name, url in zip(names, batch):
+                        self.driver.switch_to.window(name)
+                        results.append(parse(self.driver, url))
+                        self.driver.close()
+                    self.driver.switch_to.window(main_window)
+            finally:
+                for handle in self.driver.window_handles:
+                    if handle != main_window:
+                        self.driver.switch_to.window(handle)
+                        self.driver.close()
+                self.driver.switch_to.window(main_window)
+        return results
+
+    def run(self, action, *args, **kwargs):
+        """
+        Runs an action that uses the driver (e.g. cancelling a trade), waiting for any other use to finish first.
+
+        :return: The action's return value.
+        """
+        with self.lock:
+            return action(*args, **kwargs)
+
 
 class FFBot:
     """
@@ -30,6 +192,7 @@ class FFBot:
             chrome_options.add_argument('--remote-debugging-port=9222')
         # initialize driver
         self.driver = webdriver.Chrome(options=chrome_options)
+        self.tabs = TabPool(self.driver)
         self.league_id = league_id
         self.team_id = team_id
         self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{self.team_id}')
@@ -58,14 +221,54 @@ class FFBot:
             # if not headless, should login through window
             input('confirm login')
 
-    def get_transactions(self, verify_callback=None):
+    def read_team_notes(self):
+        """
+        Reads the team notes on the home page in one page load, without opening any of them.
+
+        :return: A hash of the notes (any new, changed or removed transaction changes it, so it's a cheap check
+            before a full sweep of the transactions) and the list of transactions, as from list_transactions.
+        """
+        self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{self.team_id}')
+        try:
+            WebDriverWait(self.driver, 3).until(
+                EC.presence_of_element_located((By.ID, 'teamnotes'))
+            )
+        except TimeoutException:
+            pass
+        html, notes = self.driver.execute_script(TEAM_NOTES_SCRIPT)
+        transactions = []
+        for urls in notes:
+            # keep the note's transaction link over any team or player links before it
+            links = sorted(((transaction_type(url), url) for url in urls), key=lambda link: link[0] is None)
+            if links:
+                transactions.append(links[0])
+        return hashlib.sha1(html.encode()).hexdigest(), transactions
+
+    def list_transactions(self):
+        """
+        Reads the links in the team notes, without opening any of them.
+
+        :return: A list of (type, URL) tuples, in the order of the team notes. Type is one of TRANSACTION_TYPES, or
+            None if it couldn't be told from the URL.
+        """
+        return self.read_team_notes()[1]
+
+    def get_transactions(self, verify_callback=None, kind=None, notes=None):
         """
         Gets all active transactions.
 
-        :param link_text: Text contained within a link to search for on each transaction. If specified, only
-            transactions where link_text is found will be returned.
+        :param verify_callback: A function taking the driver on a transaction's page, returning True if the
+            transaction should be included. Each team note is clicked through to check it.
+        :param kind: One of TRANSACTION_TYPES. If specified, the team notes are read in one page load and filtered by
+            their URLs instead of being clicked through (verify_callback is ignored).
+        :param notes: With kind, the transactions already read by read_team_notes, to save reloading the page.
         :return: A list of URLs pointing to the transactions.
         """
+        if kind is not None:
+            if notes is None:
+                notes = self.list_transactions()
+            return [url for url_kind, url in notes if url_kind == kind]
+
         transactions = []
         i = 0
         home_url = f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{self.team_id}'
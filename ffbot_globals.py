@@ -1,5 +1,202 @@
+import csv
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+PLAYER_DATA_PATH = 'player-data/raw_player_data.csv'
+PLAYER_LISTS_PATTERN = 'player-lists/*.json'
+NAME_CACHE_PATH = 'player-data/player_names.json'
+
+PLAYER_URL = 'https://sports.yahoo.com/nfl/players/'
+
+# one record per player in a team's stat tables
+PROJECTION_DTYPE = np.dtype([('player_id', 'U16'), ('position', 'U8'), ('proj_pts', 'f8')])
+# column of fantasy points when the header can't be read (the 6th, as in statTable0)
+DEFAULT_POINTS_COLUMN = 5
+
+
+def with_retries(fetch, *args, retries=3, backoff=1, **kwargs):
+    """
+    Calls fetch, retrying with exponential backoff if it raises.
+
+    :param fetch: The function to call.
+    :param retries: Number of retries before the exception is raised.
+    :param backoff: Seconds to wait before the first retry; doubled after each retry.
+    :return: The return value of fetch.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fetch(*args, **kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+class NameCache:
+    """
+    LRU cache of player IDs to names. Entries expire after a time to live, and the cache is saved to disk so it
+    carries over between runs.
+    """
+
+    def __init__(self, path=NAME_CACHE_PATH, ttl=7 * 24 * 60 * 60, maxsize=4096):
+        """
+        Constructor for NameCache. Loads any entries saved at path.
+
+        :param path: The .json file the cache is saved to.
+        :param ttl: The number of seconds a name is kept.
+        :param maxsize: The number of names kept in memory; the least recently used are dropped first.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries.update((player_id, tuple(entry)) for player_id, entry in json.load(f).items())
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def get(self, player_id):
+        """
+        :return: The cached name, or None if it isn't cached or has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(player_id)
+            if entry is None:
+                return None
+            name, saved_at = entry
+            if time.time() - saved_at > self.ttl:
+                del self.entries[player_id]
+                return None
+            self.entries.move_to_end(player_id)
+            return name
+
+    def set(self, player_id, name):
+        with self.lock:
+            self.entries[player_id] = (name, time.time())
+            self.entries.move_to_end(player_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        with self.lock:
+            entries = dict(self.entries)
+        with open(self.path, 'w') as f:
+            json.dump(entries, f, indent=4)
+
+
+# created on first use, so importing this module doesn't touch the network or disk
+session = None
+name_cache = None
+local_names_cache = None
+lazy_lock = threading.Lock()
+
+
+def get_session():
+    """
+    :return: The requests session shared by all requests, so connections are reused.
+    """
+    global session
+    with lazy_lock:
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+
+def get_name_cache():
+    """
+    :return: The NameCache shared by all name lookups, loaded from NAME_CACHE_PATH on first use.
+    """
+    global name_cache
+    with lazy_lock:
+        if name_cache is None:
+            name_cache = NameCache()
+    return name_cache
+
+
+def local_names():
+    """
+    Reads player names from the local player data (the player csv and the player-lists .json files). Read once.
+
+    :return: A dict of player IDs (as strings) to names.
+    """
+    global local_names_cache
+    if local_names_cache is None:
+        names = {}
+        for path in glob.glob(PLAYER_LISTS_PATTERN):
+            with open(path) as f:
+                names.update((str(player_id), name) for player_id, name in json.load(f))
+        if os.path.exists(PLAYER_DATA_PATH):
+            with open(PLAYER_DATA_PATH, newline='') as f:
+                for row in csv.DictReader(f):
+                    names[row.get('Player ID', row.get(''))] = row['name']
+        local_names_cache = names
+    return local_names_cache
+
+
+def fetch_name(player_id):
+    """
+    Fetches a player's name from their Yahoo Sports page.
+
+    :param player_id: A player ID number.
+    :return: The player's name.
+    """
+    response = get_session().get(f'{PLAYER_URL}{player_id}/', timeout=10)
+    soup = BeautifulSoup(response.text, 'html.parser', parse_only=SoupStrainer('span', class_='ys-name'))
+    return soup.find('span', class_='ys-name').text
+
+
+def ids_to_names(player_ids, max_workers=8):
+    """
+    Finds the names of many players. Names are looked up in the local player data, then the name cache, and any
+    left over are fetched from Yahoo concurrently.
+
+    :param player_ids: A list of player ID numbers.
+    :param max_workers: The number of pages to fetch at once.
+    :return: A list of names, in the same order as player_ids. None for players whose pages couldn't be fetched
+        (after retries).
+    """
+    player_ids = [str(player_id) for player_id in player_ids]
+    name_cache = get_name_cache()
+    names = {}
+    for player_id in set(player_ids):
+        name = local_names().get(player_id) or name_cache.get(player_id)
+        if name is not None:
+            names[player_id] = name
+
+    missing = [player_id for player_id in set(player_ids) if player_id not in names]
+    if missing:
+        def fetch(player_id):
+            try:
+                return with_retries(fetch_name, player_id)
+            except Exception as e:
+                print(f'Could not find the name of player {player_id}: {e!r}')
+                return None
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for player_id, name in zip(missing, executor.map(fetch, missing)):
+                    names[player_id] = name
+                    if name is not None:
+                        name_cache.set(player_id, name)
+        finally:
+            # keep whatever was fetched, even if the lookup was interrupted
+            name_cache.save()
+
+    return [names[player_id] for player_id in player_ids]
+
 
 def id_to_name(player_id):
     """
@@ -8,21 +205,96 @@ def id_to_name(player_id):
     :param player_id: A player ID number.
     :return: The player's name.
     """
-    soup = BeautifulSoup(requests.get(f'https://sports.yahoo.com/nfl/players/{player_id}/').text, 'html.parser')
-    return soup.find('span', class_='ys-name').text
+    return ids_to_names([player_id])[0]
+
+
+# player links, in order of appearance; news links are skipped
+PLAYER_HREFS_SCRIPT = """
+return Array.from(document.querySelectorAll('a[href*="https://sports.yahoo.com/nfl/players/"]'),
+                  anchor => anchor.getAttribute('href'))
+    .filter(href => !href.includes('news'));
+"""
+
+
+def players_from_hrefs(hrefs):
+    """
+    :param hrefs: An iterable of link URLs.
+    :return: A list of the player IDs linked to, in order.
+    """
+    return [href.split('/')[-1] for href in hrefs if PLAYER_URL in href and 'news' not in href]
+
+
+def get_players_from_html(html, parser='html.parser'):
+    """
+    Gets all players linked to in a page's HTML. Only anchors are parsed.
+
+    :param html: The page's HTML.
+    :param parser: The parser for BeautifulSoup to use ('lxml' is faster, if installed).
+    :return: A list of player IDs.
+    """
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer('a', href=True))
+    return players_from_hrefs(anchor['href'] for anchor in soup.find_all('a', href=True))
 
 
 def get_players_from_page(driver):
     """
-    Gets all players on the current driver page. Used for viewing the players on a team or in a trade.
+    Gets all players on the current driver page. Used for viewing the players on a team or in a trade. Only the
+    player links are sent back from the browser, not the whole page source.
 
     :param driver: A selenium webdriver object. Players will be fetched from the driver's active page.
     :return: A list of player IDs.
     """
-    players = []
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    anchors = soup.find_all('a', href=True)
-    for anchor in anchors:
-        if 'https://sports.yahoo.com/nfl/players/' in anchor['href'] and 'news' not in anchor['href']:
-            players.append(anchor['href'].split('/')[-1])
-    return players
\ No newline at end of file
+    return players_from_hrefs(driver.execute_script(PLAYER_HREFS_SCRIPT))
+
+
+def points_column(table):
+    """
+    :param table: A stat table, as a BeautifulSoup tag.
+    :return: The index of the fantasy points column, found from the table's header.
+    """
+    header_rows = table.find('thead').find_all('tr') if table.find('thead') else []
+    if header_rows:
+        for i, cell in enumerate(header_rows[-1].find_all(['th', 'td'])):
+            if 'Fan Pts' in cell.get_text():
+                return i
+    return DEFAULT_POINTS_COLUMN
+
+
+def parse_stat_tables(html, parser='html.parser'):
+    """
+    Reads every player in the stat tables of a team page (statTable0 for offense, statTable1 and on for kickers
+    and defenses) in one parse.
+
+    :param html: The page's HTML, or just the HTML of its stat tables.
+    :param parser: The parser for BeautifulSoup to use ('lxml' is faster, if installed).
+    :return: A numpy record array with PROJECTION_DTYPE, in order of appearance. Missing points are NaN.
+    """
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer('table', id=re.compile(r'^statTable')))
+    records = []
+    for table in soup.find_all('table', id=re.compile(r'^statTable')):
+        column = points_column(table)
+        body = table.find('tbody') or table
+        for row in body.find_all('tr', recursive=False):
+            cells = row.find_all('td', recursive=False)
+            # defenses link to team pages, so fall back to the player ID Yahoo tags them with
+            player_ids = players_from_hrefs(anchor['href'] for anchor in row.find_all('a', href=True))
+            tagged = row.find(attrs={'data-ys-playerid': True})
+            if player_ids:
+                player_id = player_ids[0]
+            elif tagged is not None:
+                player_id = tagged['data-ys-playerid']
+            else:
+                # empty roster slot
+                continue
+            position = ''
+            if len(cells) > 1:
+                for span in cells[1].find_all('span'):
+                    if ' - ' in span.get_text():
+                        position = span.get_text().strip().split(' - ')[-1]
+                        break
+            try:
+                points = float(cells[column].get_text().strip())
+            except (IndexError, ValueError):
+                points = np.nan
+            records.append((player_id, position, points))
+    return np.array(records, dtype=PROJECTION_DTYPE).view(np.recarray)
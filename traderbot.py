@@ -1,15 +1,29 @@
+import hashlib
 import json
+import queue
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import numpy as np
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
-from ffbot import FFBot
+from ffbot import FFBot, Poller, transaction_type
 from ffbot_globals import *
 
+LINKS_SCRIPT = """
+return Array.from(document.querySelectorAll('a[href]'), anchor => anchor.href);
+"""
+
+STAT_TABLES_SCRIPT = """
+return Array.from(document.querySelectorAll('table[id^="statTable"]'), table => table.outerHTML);
+"""
+
 
 def detect_trade(driver):
     try:
@@ -21,23 +35,94 @@ def detect_trade(driver):
         return False
 
 
+class RosterCache:
+    """
+    Caches the players on each team, shared by all Trade objects of a TraderBot. Rosters only change when a trade
+    goes through, so a team's roster is reloaded only after a trade involving it leaves the transaction list without
+    us cancelling, rejecting or countering it (a sent trade may have been accepted by the other team, a received
+    one by us, by hand). Rosters can also be dropped by hand with invalidate (e.g. after a waiver claim).
+    """
+
+    def __init__(self, driver, league_id):
+        """
+        Constructor for RosterCache.
+
+        :param driver: A selenium webdriver object, logged into Yahoo.
+        :param league_id: The league ID.
+        """
+        self.driver = driver
+        self.league_id = league_id
+        self.rosters = {}
+        # trades that are still pending, by URL
+        self.trades = {}
+
+    def get(self, team_id):
+        """
+        :param team_id: A team ID.
+        :return: A set of the IDs of the players on the team. Loads the team page if the roster isn't cached.
+        """
+        team_id = str(team_id)
+        if team_id not in self.rosters:
+            self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{team_id}')
+            self.rosters[team_id] = set(get_players_from_page(self.driver))
+        return self.rosters[team_id]
+
+    def invalidate(self, team_ids=None):
+        """
+        Drops cached rosters.
+
+        :param team_ids: A list of team IDs to drop. If None, drops all of them.
+        """
+        if team_ids is None:
+            self.rosters.clear()
+        for team_id in team_ids or []:
+            self.rosters.pop(str(team_id), None)
+
+    def track(self, trade):
+        """
+        Records a trade after get_info, so its teams can be reloaded once it resolves.
+        """
+        if trade.received is not None:
+            self.trades[trade.url] = trade
+
+    def untrack(self, trade):
+        """
+        Stops watching a trade that was resolved without changing any rosters (it was cancelled, rejected or
+        countered).
+        """
+        self.trades.pop(trade.url, None)
+
+    def reconcile(self, active_urls):
+        """
+        Drops the rosters of teams in any watched trade that is no longer active.
+
+        :param active_urls: The URLs of all currently active transactions.
+        """
+        active_urls = set(active_urls)
+        for url in list(self.trades):
+            if url not in active_urls:
+                self.invalidate(self.trades.pop(url).teams)
+
+
 class Trade:
     """
     Represents a trade. Contains methods to fetch info about the trade and interact with the trade.
     """
 
-    def __init__(self, url, team_id, driver):
+    def __init__(self, url, team_id, driver, rosters=None):
         """
         Constructor for a Trade object.
 
         :param url: The URL for the trade.
         :param team_id: Your team ID.
         :param driver: A selenium webdriver object. All methods require a session that is logged into Yahoo.
+        :param rosters: A RosterCache to look up your team in. If None, the trade gets its own.
         """
         self.url = url
         self.league_id = self.url.split('/')[-3]
         self.team_id = str(team_id)
         self.driver = driver
+        self.rosters = rosters if rosters is not None else RosterCache(driver, self.league_id)
         # trade info attributes
         self.my_players = []
         self.other_players = []
@@ -56,45 +141,51 @@ class Trade:
 
     def get_info(self):
         """
-
-        :return:
+        Navigates to the trade and reads its info (see read_info).
         """
         if self.is_active():
-            # check if was received or sent
-            try:
-                self.driver.find_element_by_link_text('Reject Trade')
-                self.received = True
-            except NoSuchElementException:
-                self.received = False
-            # get teams
-            teams = []
-            soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-            anchors = soup.find_all('a', href=True)
-            for anchor in anchors:
-                anchor_test_list = anchor['href'].split('/')
-                if anchor_test_list[:-1] == ['', 'f1', self.league_id] and anchor_test_list[-1].isnumeric():
-                    teams.append(anchor['href'].split('/')[-1])
-            self.teams = list(set(teams))
-            # get message
-            message = soup.find('div', class_='tradenote')
-            if message is None:
-                message = ''
+            self.read_info()
+
+    def read_info(self):
+        """
+        Reads the trade's info (who sent it, the teams, the message and the players on each side) from the driver's
+        current page, which must be the trade's page.
+        """
+        # check if was received or sent
+        try:
+            self.driver.find_element_by_link_text('Reject Trade')
+            self.received = True
+        except NoSuchElementException:
+            self.received = False
+        # get teams
+        teams = []
+        soup = BeautifulSoup(self.driver.page_source, 'html.parser')
+        anchors = soup.find_all('a', href=True)
+        for anchor in anchors:
+            anchor_test_list = anchor['href'].split('/')
+            if anchor_test_list[:-1] == ['', 'f1', self.league_id] and anchor_test_list[-1].isnumeric():
+                teams.append(anchor['href'].split('/')[-1])
+        self.teams = list(set(teams))
+        # get message
+        message = soup.find('div', class_='tradenote')
+        if message is None:
+            message = ''
+        else:
+            message = message.find('p').text
+        self.message = message
+        # get involved players
+        my_players = []
+        other_players = []
+        all_players = get_players_from_page(self.driver)
+        my_team = self.rosters.get(self.team_id)
+        for player in all_players:
+            if player in my_team:
+                my_players.append(player)
             else:
-                message = message.find('p').text
-            self.message = message
-            # get involved players
-            my_players = []
-            other_players = []
-            all_players = get_players_from_page(self.driver)
-            self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{self.team_id}')
-            my_team = get_players_from_page(self.driver)
-            for player in all_players:
-                if player in my_team:
-                    my_players.append(player)
-                else:
-                    other_players.append(player)
-            self.my_players = my_players
-            self.other_players = other_players
+                other_players.append(player)
+        self.my_players = my_players
+        self.other_players = other_players
+        self.rosters.track(self)
 
     def get_other_team(self):
         """
@@ -121,6 +212,227 @@ class Trade:
             else:
                 cancel_btn = self.driver.find_element_by_link_text('Cancel Trade')
             cancel_btn.click()
+            self.rosters.untrack(self)
+
+
+def latency_report(latency):
+    """
+    :param latency: A dict of stage (or operation) names to lists of seconds taken.
+    :return: A string with the mean and max latency of each.
+    """
+    return '\t'.join(f'{stage}: mean {sum(seconds) / len(seconds):.2f}s, max {max(seconds):.2f}s'
+                     for stage, seconds in latency.items() if seconds)
+
+
+class GameEngine:
+    """
+    Runs one game per team through trades, in stages: the received trades are fetched together, the games compute
+    their responses in parallel (one worker per team, since only different teams' games are independent), and the
+    counters are sent one at a time from a send queue. Records the latency of each
+    stage.
+    """
+
+    def __init__(self, bot, game, trades_to_send, log=True, max_workers=None):
+        """
+        Constructor for GameEngine. Looks up every team's name once.
+
+        :param bot: A TraderBot.
+        :param game: An extension of the Game abstract class; one is created per team.
+        :param trades_to_send: A dict of team IDs to the junk trade sent to them (see generate_junk_trades).
+        :param log: If True, prints game updates to the console.
+        :param max_workers: The number of games that can compute responses at once.
+        """
+        self.bot = bot
+        self.trades_to_send = trades_to_send
+        self.log = log
+        self.games = {team: game() for team in trades_to_send.keys()}
+        self.team_names = bot.team_names(list(self.games))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # seconds taken by each stage; 'response' is from the start of the fetch until the counter is sent
+        self.latency = defaultdict(list)
+        self.latency_lock = threading.Lock()
+        # URLs of received trades whose counters haven't been sent yet
+        self.pending = set()
+        self.sends = queue.Queue()
+        self.sender = threading.Thread(target=self.send_counters, daemon=True)
+        self.sender.start()
+
+    def record(self, stage, seconds):
+        with self.latency_lock:
+            self.latency[stage].append(seconds)
+
+    def fetch(self, notes=None):
+        """
+        :param notes: The transactions already read by read_team_notes, to save reloading the home page.
+        :return: The received trades that haven't been responded to yet.
+        """
+        start = time.perf_counter()
+        with self.bot.tabs.lock:
+            trades = [trade for trade in self.bot.get_trades(info=True, notes=notes)
+                      if trade.received and trade.url not in self.pending]
+        self.record('fetch', time.perf_counter() - start)
+        return trades
+
+    def respond(self, trades):
+        """
+        Computes one team's responses, in the order its trades were sent. A game is only ever used by one worker at
+        a time, so only different teams' games run in parallel.
+
+        :param trades: A list of received trades, all from the same team.
+        :return: A list of (trade, prompt, log) tuples. The log is read right after the action, so the sender never
+            touches the game.
+        """
+        responses = []
+        for trade in sorted(trades, key=lambda trade: int(trade.url.split('=')[-1])):
+            game = self.games[trade.get_other_team()]
+            start = time.perf_counter()
+            prompt = game.action(trade.message)
+            self.record('action', time.perf_counter() - start)
+            responses.append((trade, prompt, game.log() if self.log else None))
+        return responses
+
+    def step(self, notes=None):
+        """
+        Fetches the received trades, computes every game's response and queues the counters.
+
+        :param notes: The transactions already read by read_team_notes, to save reloading the home page.
+        :return: The number of trades responded to.
+        """
+        started = time.perf_counter()
+        trades = self.fetch(notes)
+        by_team = defaultdict(list)
+        for trade in trades:
+            by_team[trade.get_other_team()].append(trade)
+        for responses in self.executor.map(self.respond, by_team.values()):
+            for trade, prompt, log in responses:
+                self.pending.add(trade.url)
+                self.sends.put((trade, prompt, log, started))
+        return len(trades)
+
+    def send_counters(self):
+        while True:
+            trade, prompt, log, started = self.sends.get()
+            other_team = trade.get_other_team()
+            start = time.perf_counter()
+            # hold the driver until the trade is off the pending list, so a fetch can't see it half done
+            with self.bot.tabs.lock:
+                try:
+                    self.bot.counter_trade(trade, self.trades_to_send[other_team], message=prompt)
+                except Exception as e:
+                    print(f'Could not counter trade {trade.url}: {e!r}')
+                    continue
+                finally:
+                    self.pending.discard(trade.url)
+            self.record('send', time.perf_counter() - start)
+            self.record('response', time.perf_counter() - started)
+            if log is not None:
+                print(f'{self.team_names.get(other_team, other_team)}: {log}')
+
+    def report(self):
+        """
+        :return: A string with the mean and max latency of each stage.
+        """
+        with self.latency_lock:
+            latency = {stage: list(seconds) for stage, seconds in self.latency.items()}
+        return latency_report(latency)
+
+    def shutdown(self):
+        """
+        Waits for the queued counters to be sent, then stops the workers.
+        """
+        while self.pending:
+            time.sleep(0.1)
+        self.executor.shutdown()
+
+
+class TradePipeline:
+    """
+    Sends batches of trades and cancels them. Sent trades are indexed by their set of players, so cancelling one
+    goes straight to its page instead of searching through every active trade. Records the latency of each
+    operation and the overall throughput.
+    """
+
+    def __init__(self, bot):
+        """
+        Constructor for TradePipeline.
+
+        :param bot: A TraderBot.
+        """
+        self.bot = bot
+        # frozenset of player IDs -> the sent Trade
+        self.trades = {}
+        # player sets of trades that were sent but couldn't be found afterwards
+        self.unresolved = set()
+        self.sent = 0
+        self.latency = defaultdict(list)
+        self.started = time.perf_counter()
+
+    def send(self, specs, message=''):
+        """
+        Sends a batch of trades.
+
+        :param specs: A list of tuples, each containing the target team ID and a list of player IDs.
+        :param message: Custom message to send along with each trade.
+        :return: A list of the sent trades that were found. Trades that couldn't be found after sending are resolved
+            later, by cancel.
+        """
+        sent = []
+        for other_team, players in specs:
+            start = time.perf_counter()
+            trade = self.bot.tabs.run(self.bot.create_trade, other_team, players, message)
+            self.latency['create'].append(time.perf_counter() - start)
+            key = frozenset(map(str, players))
+            if trade:
+                self.trades[key] = trade
+                sent.append(trade)
+                self.sent += 1
+            elif trade is None:
+                # sent, but not found (or rejected right away)
+                self.unresolved.add(key)
+                self.sent += 1
+        return sent
+
+    def resolve(self):
+        """
+        Finds the trades that couldn't be found after sending, with one sweep of the active trades.
+        """
+        if not self.unresolved:
+            return
+        for trade in self.bot.get_trades(info=True):
+            key = frozenset(trade.get_players())
+            if not trade.received and key in self.unresolved:
+                self.trades[key] = trade
+                self.unresolved.discard(key)
+        # whatever is left was rejected or never went through
+        self.unresolved.clear()
+
+    def cancel(self, players=None):
+        """
+        Cancels sent trades.
+
+        :param players: The list of player IDs of the trade to cancel. If None, cancels every trade sent.
+        """
+        if players is None:
+            self.resolve()
+            keys = list(self.trades)
+        else:
+            keys = [frozenset(map(str, players))]
+            if keys[0] in self.unresolved:
+                self.resolve()
+        for key in keys:
+            trade = self.trades.pop(key, None)
+            if trade is not None:
+                start = time.perf_counter()
+                self.bot.tabs.run(trade.cancel)
+                self.latency['cancel'].append(time.perf_counter() - start)
+
+    def report(self):
+        """
+        :return: A string with the trades sent per minute and the latency of each operation.
+        """
+        minutes = (time.perf_counter() - self.started) / 60
+        throughput = self.sent / minutes if minutes > 0 else 0
+        return f'{throughput:.1f} trades/min\t' + latency_report(self.latency)
 
 
 class TraderBot(FFBot):
@@ -128,16 +440,48 @@ class TraderBot(FFBot):
     Contains bindings for trade actions.
     """
 
-    def get_trades(self):
+    def __init__(self, league_id, team_id, headless=False):
+        super().__init__(league_id, team_id, headless=headless)
+        # shared by every Trade this bot creates
+        self.rosters = RosterCache(self.driver, self.league_id)
+
+    def get_trades(self, info=False, notes=None):
         """
         Gets all active trades.
 
+        :param info: If True, also reads every trade's info (see inspect_trades).
+        :param notes: The transactions already read by read_team_notes, to save reloading the home page.
         :return: A list of Trade objects.
         """
 
-        trades = self.get_transactions(detect_trade)
+        trades = self.get_transactions(kind='trade', notes=notes)
+        self.rosters.reconcile(trades)
+
+        trades = [Trade(trade, self.team_id, self.driver, self.rosters) for trade in trades]
+        if info:
+            trades = self.inspect_trades(trades)
+        return trades
+
+    def inspect_trades(self, trades):
+        """
+        Reads the info of many trades at once, loading their pages in parallel tabs.
+
+        :param trades: A list of Trade objects.
+        :return: The trades that are still active, with their info read.
+        """
+        # load our roster first so no tab has to navigate away to find it
+        self.tabs.run(self.rosters.get, self.team_id)
+
+        by_url = {trade.url: trade for trade in trades}
 
-        return [Trade(trade, self.team_id, self.driver) for trade in trades]
+        def read(driver, url):
+            if detect_trade(driver):
+                by_url[url].read_info()
+                return True
+            return False
+
+        is_active = self.tabs.map(list(by_url), read)
+        return [trade for trade, active in zip(by_url.values(), is_active) if active]
 
     def team_id_to_name(self, team_id):
         """
@@ -153,23 +497,51 @@ class TraderBot(FFBot):
 
         return team_name
 
-    def permacancel(self, interval, method=None):
+    def team_names(self, team_ids):
+        """
+        Finds the names of many teams at once, loading their pages in parallel tabs.
+
+        :param team_ids: A list of team ID numbers.
+        :return: A dict of team IDs to team names.
+        """
+        def read(driver, url):
+            # the tab may still be loading
+            team_name = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.XPATH, '//*[@id="team-card-info"]/div[2]/ul/li/a'))
+            )
+            return ' '.join(team_name.text.strip().split()[:-2])
+
+        urls = [f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{team_id}' for team_id in team_ids]
+        return dict(zip(team_ids, self.tabs.map(urls, read)))
+
+    def permacancel(self, interval, method=None, poller=None):
         """
-        Cancels all trades repeatedly.
+        Cancels all trades repeatedly. Trades are only swept when the team notes change.
 
-        :param interval: The number of seconds between cancels.
+        :param interval: The number of seconds between checks right after a cancel; backs off while idle.
         :param method: Specify whether to cancel sent trades ('Cancel'), reject received trades ('Reject'), or both
             (default).
+        :param poller: A Poller to schedule checks with. Defaults to one with min_interval=interval.
         """
-        i = 0
+        if poller is None:
+            poller = Poller(min_interval=interval, max_interval=max(interval, 300))
+        last_hash = None
         while True:
-            i += 1
-            for trade in self.get_trades():
-                trade.get_info()
-                received = trade.received
-                if method is None or (method == 'Reject' and received) or (method == 'Cancel' and not received):
-                    trade.cancel()
-            time.sleep(interval)
+            notes_hash, notes = self.tabs.run(self.read_team_notes)
+            cancelled = False
+            if notes_hash != last_hash:
+                for trade in self.get_trades(info=True, notes=notes):
+                    received = trade.received
+                    if method is None or (method == 'Reject' and received) or (method == 'Cancel' and not received):
+                        self.tabs.run(trade.cancel)
+                        cancelled = True
+                # cancelling changes the notes, so check again after
+                last_hash = None if cancelled else notes_hash
+            if cancelled:
+                poller.activity()
+            else:
+                poller.idle()
+            poller.wait()
 
     def fill_and_submit_trade(self, players, message):
         """
@@ -208,12 +580,16 @@ class TraderBot(FFBot):
         send_trade_button = WebDriverWait(self.driver, 10).until(
             EC.presence_of_element_located((By.LINK_TEXT, 'Send Trade Proposal'))
         )
+        sending_url = self.driver.current_url
         send_trade_button.click()
 
-        # find the sent trade and return it
+        trade = self.find_sent_trade(sending_url, players)
+        if trade is not None:
+            return trade
+
+        # fall back to checking every trade
         possible_trades = []
-        for trade in self.get_trades():
-            trade.get_info()
+        for trade in self.get_trades(info=True):
             if not trade.received:
                 if sorted(trade.get_players()) == sorted(players):
                     possible_trades.append(trade)
@@ -224,6 +600,41 @@ class TraderBot(FFBot):
         except IndexError:
             return None
 
+    def find_sent_trade(self, sending_url, players, timeout=3):
+        """
+        Finds a trade that was just sent from the confirmation page it redirects to: either the trade's own page, or
+        a page linking to it (the newest trade linked is taken). To be called in fill_and_submit_trade.
+
+        :param sending_url: The URL of the page the trade was sent from.
+        :param players: The players in the sent trade, used to check the trade found.
+        :param timeout: The number of seconds to wait for the redirect (or the sent trade's 'Cancel Trade' link).
+        :return: The sent trade, as a Trade object with its info read. None if it can't be found this way.
+        """
+        def confirmed(driver):
+            return driver.current_url != sending_url or len(driver.find_elements_by_link_text('Cancel Trade')) > 0
+
+        try:
+            WebDriverWait(self.driver, timeout).until(confirmed)
+        except TimeoutException:
+            return None
+
+        url = self.driver.current_url
+        if transaction_type(url) == 'trade' and detect_trade(self.driver):
+            trade = Trade(url, self.team_id, self.driver, self.rosters)
+            trade.read_info()
+        else:
+            urls = [link for link in self.driver.execute_script(LINKS_SCRIPT) if transaction_type(link) == 'trade']
+            urls = [link for link in urls if link.split('=')[-1].isnumeric()]
+            if len(urls) == 0:
+                return None
+            trade = Trade(max(urls, key=lambda link: int(link.split('=')[-1])), self.team_id, self.driver,
+                          self.rosters)
+            trade.get_info()
+
+        if trade.received is False and sorted(trade.get_players()) == sorted(players):
+            return trade
+        return None
+
     def create_trade(self, other_team, players, message=''):
         """
         Submits a trade.
@@ -257,143 +668,238 @@ class TraderBot(FFBot):
             )
             counter_trade_button.click()
 
-            return self.fill_and_submit_trade(players=players, message=message)
+            new_trade = self.fill_and_submit_trade(players=players, message=message)
+            if new_trade is not False:
+                # countered, not accepted: the old trade leaves the list without changing any rosters
+                self.rosters.untrack(trade)
+            return new_trade
         return None
 
-    def run_game(self, game, log=True):
+    def run_game(self, game, log=True, poller=None, max_workers=None):
         """
-        Runs a given game by reading and responding to trade notes and countering trades.
+        Runs a given game by reading and responding to trade notes and countering trades. See GameEngine.
 
         :param game: An extension of the Game abstract class.
         :param log: If True, prints game updates to the console.
+        :param poller: A Poller to schedule checks for trades with. Defaults to Poller().
+        :param max_workers: The number of games that can compute responses at once.
         """
         with open('junktrades/trades_to_send.json') as f:
             trades_to_send = json.load(f)
 
-        games = {team: game() for team in trades_to_send.keys()}
+        engine = GameEngine(self, game, trades_to_send, log=log, max_workers=max_workers)
 
+        if poller is None:
+            poller = Poller()
         interval = 0
-        counter = 0
+        last_hash = None
 
-        while True:
-            log_str = 'Checking for trades...'
-            current_time = datetime.now().time()
-            log_str += f'\tTime: {current_time.hour}:{current_time.minute}:{current_time.second}'
-            log_str += f'\tInterval: {interval}s'
-            print(log_str)
-            for trade in self.get_trades():
-                trade.get_info()
-                if trade.received:
-                    other_team = trade.get_other_team()
-                    current_game = games[other_team]
-                    prompt = current_game.action(trade.message)
-                    self.counter_trade(trade, trades_to_send[other_team], message=prompt)
+        try:
+            while True:
+                log_str = 'Checking for trades...'
+                current_time = datetime.now().time()
+                log_str += f'\tTime: {current_time.hour}:{current_time.minute}:{current_time.second}'
+                log_str += f'\tInterval: {interval:.0f}s'
+                print(log_str)
+                # only sweep the trades if the team notes changed
+                notes_hash, notes = self.tabs.run(self.read_team_notes)
+                received = False
+                if notes_hash != last_hash:
+                    received = engine.step(notes) > 0
+                    # countering changes the notes, so check again after
+                    last_hash = None if received else notes_hash
+                if received:
                     if log:
-                        print(f'{self.team_id_to_name(other_team)}: {current_game.log()}')
-                    counter = 0
-            time.sleep(interval)
-            if counter < 5:
-                interval = 5
-            elif counter < 15:
-                interval = 10
-            elif counter < 60:
-                interval = 60
-            else:
-                interval = 300
-            counter += 1
+                        print(engine.report())
+                    poller.activity()
+                else:
+                    poller.idle()
+                interval = poller.wait()
+        finally:
+            engine.shutdown()
 
-    def generate_junk_trades(self, write=True):
+    def load_team(self, team_id):
         """
-        Creates .json files containing junk trades for each other team (i.e. my worst player for your best player).
-        Used when sending trades with messages and for identifying received trades with messages.
+        Navigates to a team's page.
 
-        :param write: If True, writes the .json files; if False, doesn't.
-        :return: Two dicts containing the trades to send and the trades to receive (formatted as lists of players).
+        :param team_id: A team ID.
+        :return: The list of player IDs on the team, in order of appearance. Empty if the team doesn't exist.
         """
-        trades_to_send = {}
-        trades_to_receive = {}
+        self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{team_id}')
+        return get_players_from_page(self.driver)
+
+    def show_projections(self):
+        """
+        Switches the team page loaded by load_team to projected stats for this season.
+        """
+        projected_stats_button = self.driver.find_element_by_id('P')
+        projected_stats_button.click()
+        this_season_button = self.driver.find_element_by_xpath('//*[@id="subnav_P"]/li[4]/a')
+        this_season_button.click()
+
+        # the first element takes time to switch to projected stats
+        # can't be solved with explicit wait since the xpath destination exists prior to change
+        time.sleep(2)
+
+    def stat_tables(self):
+        """
+        :return: A list of the HTML of each stat table on the current page (statTable0, statTable1, ...), read with
+            one script call.
+        """
+        return self.driver.execute_script(STAT_TABLES_SCRIPT)
+
+    def roster_fingerprint(self, players):
+        """
+        :param players: The list of player IDs on a team.
+        :return: A hex digest string of the roster, readable from the team page without switching to projections.
+        """
+        return hashlib.sha1(json.dumps(players).encode()).hexdigest()
+
+    def team_fingerprint(self, players, projections):
+        """
+        Fingerprints a team from its roster and projections only, so changes elsewhere in the stat tables (owned %,
+        opponents, game status) don't count.
+
+        :param players: The list of player IDs on the team.
+        :param projections: The team's projections, from read_team_projections.
+        :return: A hex digest string.
+        """
+        records = [(str(player_id), str(position), float(points))
+                   for player_id, position, points in projections.tolist()]
+        return hashlib.sha1(json.dumps([players, records]).encode()).hexdigest()
+
+    def read_team_projections(self, tables):
+        """
+        Reads the projected points of every player (kickers and defenses included) from a team's stat tables.
+
+        :param tables: The team's stat tables, from stat_tables, after show_projections.
+        :return: A record array of player_id, position and proj_pts (see parse_stat_tables). QBs are adjusted down by
+            150 points, to prioritize other positions.
+        """
+        records = parse_stat_tables(''.join(tables))
+        records.proj_pts[records.position == 'QB'] -= 150
+        return records
+
+    def scan_junk_trades(self, trades_to_send, trades_to_receive, fingerprints, rescan=False):
+        """
+        Visits every team page and updates the junk trades of each team whose fingerprint changed. Used by
+        generate_junk_trades and update_junk_trades.
+
+        A team's roster is read from its default page first. Unless rescan is True, teams whose roster is unchanged
+        are skipped without switching to projections, so projection changes alone (with the same roster) aren't
+        picked up; rescan reads every team's projections, which only saves rewriting unchanged trades.
+
+        :param trades_to_send: The dict of trades to send, updated in place.
+        :param trades_to_receive: The dict of trades to receive, updated in place.
+        :param fingerprints: A dict of team IDs to their fingerprints from the last scan, updated in place.
+        :param rescan: If True, reads the projections of teams whose roster didn't change too.
+        :return: A list of the team IDs whose fingerprints changed (including your own).
+        """
+        changed = []
         i = 1
         while True:
-            if i == self.team_id:
-                i += 1
+            team = str(i)
+            i += 1
+            if team == str(self.team_id):
                 continue
 
-            self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{i}')
-
             # breaks after hitting the last team
-            players = get_players_from_page(self.driver)
+            players = self.load_team(team)
             if len(players) == 0:
                 break
 
-            # switch to projected stats for this season
-            projected_stats_button = self.driver.find_element_by_id('P')
-            projected_stats_button.click()
-            this_season_button = self.driver.find_element_by_xpath('//*[@id="subnav_P"]/li[4]/a')
-            this_season_button.click()
-
-            # the first element takes time to switch to projected stats
-            # can't be solved with explicit wait since the xpath destination exists prior to change
-            time.sleep(2)
-
-            player_list = []
-            # takes advantage of the fact that get_players_from_page returns in order of appearance on page
-            for j, player in enumerate(players, 1):
-                # note: doesn't get kickers/defenses
-                # those are in different tables (statTable1, etc.)
-                proj_pt_xpath = f'//*[@id="statTable0"]/tbody/tr[{j}]/td[6]/div/span'
-                try:
-                    player_proj_pts = self.driver.find_element_by_xpath(proj_pt_xpath)
-                except NoSuchElementException:
-                    # will occur for kickers/defenses
-                    break
-                player_proj_pts = float(player_proj_pts.text)
-
-                # adjust qb points down to prioritize other positions
-                position_xpath = f'//*[@id="statTable0"]/tbody/tr[{j}]/td[2]/div/div/div/span'
-                try:
-                    player_position = self.driver.find_element_by_xpath(position_xpath)
-                except NoSuchElementException:
-                    # shouldn't happen since break would occur above if player doesn't exist
-                    player_position = ''
-                player_position = player_position.text.split(' - ')[-1]
-
-                if player_position == 'QB':
-                    player_proj_pts -= 150
+            known = fingerprints.get(team, {})
+            roster = self.roster_fingerprint(players)
+            have_trades = team in trades_to_send and team in trades_to_receive
+            if not rescan and known.get('roster') == roster and have_trades:
+                continue
 
-                player_list.append((player, player_proj_pts))
+            self.show_projections()
+            projections = self.read_team_projections(self.stat_tables())
+            fingerprint = {'roster': roster, 'projections': self.team_fingerprint(players, projections)}
+            if known == fingerprint and have_trades:
+                continue
+            fingerprints[team] = fingerprint
+            changed.append(team)
 
             # get player w/ highest proj. pts
-            trades_to_send[i] = [sorted(player_list, key=lambda x: -x[1])[0][0]]
-            trades_to_receive[i] = [sorted(player_list, key=lambda x: x[1])[0][0]]
-
-            i += 1
-
-        self.driver.get(f'https://football.fantasysports.yahoo.com/f1/{self.league_id}/{self.team_id}')
-        my_players = get_players_from_page(self.driver)
+            trades_to_send[team] = [str(projections.player_id[np.nanargmax(projections.proj_pts)])]
+            trades_to_receive[team] = [str(projections.player_id[np.nanargmin(projections.proj_pts)])]
+
+        my_players = self.load_team(self.team_id)
+        fingerprint = {'roster': self.roster_fingerprint(my_players)}
+        if fingerprints.get(str(self.team_id)) != fingerprint:
+            fingerprints[str(self.team_id)] = fingerprint
+            changed.append(str(self.team_id))
+            # every trade needs my new players
+            changed_trades = list(trades_to_send)
+        else:
+            changed_trades = changed
 
         # gets the last player on the page
         # usually the kicker (doesn't count defenses)
         # takes last bench player (or IR) if team doesn't have a kicker
-        player_to_trade_away = my_players[-1]
-        for trade in trades_to_send.values():
-            trade.append(player_to_trade_away)
+        for team in changed_trades:
+            trades_to_send[team][1:] = [my_players[-1]]
 
         # gets the first player (usually qb)
-        player_to_trade_away = my_players[0]
-        for trade in trades_to_receive.values():
-            trade.append(player_to_trade_away)
+        for team in changed_trades:
+            trades_to_receive[team][1:] = [my_players[0]]
+
+        return changed
+
+    def generate_junk_trades(self, write=True):
+        """
+        Creates .json files containing junk trades for each other team (i.e. my worst player for your best player).
+        Used when sending trades with messages and for identifying received trades with messages.
+
+        :param write: If True, writes the .json files; if False, doesn't.
+        :return: Two dicts containing the trades to send and the trades to receive (formatted as lists of players).
+        """
+        trades_to_send = {}
+        trades_to_receive = {}
+        fingerprints = {}
+        self.scan_junk_trades(trades_to_send, trades_to_receive, fingerprints)
 
         if write:
-            self.write_junk_trades(trades_to_send, trades_to_receive)
+            self.write_junk_trades(trades_to_send, trades_to_receive, fingerprints)
 
         return trades_to_send, trades_to_receive
 
-    def write_junk_trades(self, trades_to_send, trades_to_receive):
+    def update_junk_trades(self, rescan=False):
+        """
+        Updates the junk trade .json files in place, rereading the projections of only the teams whose rosters changed
+        since the files were written. Creates the files if there are none yet.
+
+        :param rescan: If True, rereads every team's projections, and updates the teams whose projections changed
+            too (see scan_junk_trades).
+        :return: A list of the team IDs whose junk trades were updated.
+        """
+        try:
+            with open('junktrades/trades_to_send.json') as f:
+                trades_to_send = json.load(f)
+            with open('junktrades/trades_to_receive.json') as f:
+                trades_to_receive = json.load(f)
+        except FileNotFoundError:
+            trades_to_send, trades_to_receive = {}, {}
+        try:
+            with open('junktrades/fingerprints.json') as f:
+                fingerprints = json.load(f)
+        except FileNotFoundError:
+            fingerprints = {}
+
+        changed = self.scan_junk_trades(trades_to_send, trades_to_receive, fingerprints, rescan=rescan)
+        if changed:
+            self.write_junk_trades(trades_to_send, trades_to_receive, fingerprints)
+        return changed
+
+    def write_junk_trades(self, trades_to_send, trades_to_receive, fingerprints=None):
         """
         Writes the .json files created from generate_junk_trades. Also prints the dicts through view_junk_trades.
 
         :param trades_to_send: The dict of trades to send.
         :param trades_to_receive: The dict of trades to receive.
+        :param fingerprints: The dict of team fingerprints the trades were made from, used by update_junk_trades.
         """
         with open('junktrades/trades_to_send.json', 'w') as f:
             json.dump(trades_to_send, f, indent=4)
@@ -401,34 +907,51 @@ class TraderBot(FFBot):
         with open('junktrades/trades_to_receive.json', 'w') as f:
             json.dump(trades_to_receive, f, indent=4)
 
+        if fingerprints is not None:
+            with open('junktrades/fingerprints.json', 'w') as f:
+                json.dump(fingerprints, f, indent=4)
+
         self.view_junk_trades()
 
-    def safe_generate_junk_trades(self):
+    def safe_generate_junk_trades(self, interval=3600, stable_snapshots=2, max_snapshots=24):
         """
-        Calls generate_junk_trades multiple times with time in between to protect against significant projection
-        changes. To be run continuously. Writes the .json files once finalized.
+        Updates the junk trades repeatedly with time in between to protect against significant projection changes,
+        until no team has changed for stable_snapshots updates in a row. The .json files are updated in place.
+
+        :param interval: The number of seconds between updates.
+        :param stable_snapshots: The number of updates in a row with no changes needed to finish.
+        :param max_snapshots: The most updates to run before finishing anyway.
+        :return: True if the junk trades settled, False if max_snapshots was reached first.
         """
-        trades_to_send, trades_to_receive = None, None
-        new_trades_to_send, new_trades_to_receive = self.generate_junk_trades(write=False)
-        while trades_to_send != new_trades_to_send and trades_to_receive != new_trades_to_receive:
-            time.sleep(21600)
-            new_trades_to_send, new_trades_to_receive = self.generate_junk_trades(write=False)
-        self.write_junk_trades(new_trades_to_send, new_trades_to_receive)
+        stable = 0
+        for _ in range(max_snapshots):
+            # projections can change without a roster move, so every team's projections are reread
+            stable = stable + 1 if len(self.update_junk_trades(rescan=True)) == 0 else 0
+            if stable >= stable_snapshots:
+                return True
+            time.sleep(interval)
+        return False
 
     def view_junk_trades(self):
         """
         Prints the current junk trades, using the player names.
         """
-        print('Trades to send:')
         with open('junktrades/trades_to_send.json') as f:
-            trades = json.load(f)
-        for team, players, in trades.items():
-            print(f'Team {team}: {[id_to_name(player) for player in players]}')
-        print('\nTrades to receive:')
+            trades_to_send = json.load(f)
         with open('junktrades/trades_to_receive.json') as f:
-            trades = json.load(f)
-        for team, players, in trades.items():
-            print(f'Team {team}: {[id_to_name(player) for player in players]}')
+            trades_to_receive = json.load(f)
+
+        # look up every name at once
+        player_ids = [player for trades in (trades_to_send, trades_to_receive)
+                      for players in trades.values() for player in players]
+        names = dict(zip(map(str, player_ids), ids_to_names(player_ids)))
+
+        print('Trades to send:')
+        for team, players, in trades_to_send.items():
+            print(f'Team {team}: {[names[str(player)] for player in players]}')
+        print('\nTrades to receive:')
+        for team, players, in trades_to_receive.items():
+            print(f'Team {team}: {[names[str(player)] for player in players]}')
 
     def trade_spam(self, targets, n, interval):
         """
@@ -438,21 +961,18 @@ class TraderBot(FFBot):
         Example: [('1', ['27581', '30259', '25802']), ('6', ['25802', '31056', '31268'])]
         :param n: The number of times to send the specified trades.
         :param interval: The number of seconds to wait between sending (and cancelling) trades.
+        :return: The TradePipeline used, with its latency stats.
         """
+        pipeline = TradePipeline(self)
         for i in range(n):
             # sends custom message with number and time sent
             message = f'Trade {i + 1}/{n}, Time sent: {datetime.now()}'
             print('\r' + message, end='')
-            for target in targets:
-                self.create_trade(target[0], target[1], message)
+            pipeline.send(targets, message)
             time.sleep(interval)
-            for trade in self.get_trades():
-                players = sorted(trade.get_players())
-                for target in targets:
-                    if players == sorted(target[1]):
-                        trade.cancel()
-                        break
-
+            pipeline.cancel()
+        print('\n' + pipeline.report())
+        return pipeline
 
 if __name__ == '__main__':
     bot = TraderBot('your league ID here', 'your team ID here')
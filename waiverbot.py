@@ -50,7 +50,7 @@ class Waiver:
 class WaiverBot(FFBot):
 
     def get_waivers(self):
-        waivers = self.get_transactions(detect_waiver)
+        waivers = self.get_transactions(kind='waiver')
         return [Waiver(waiver, self.driver) for waiver in waivers]
 
     def create_waiver(self, player_to_add, player_to_drop, bid=0):